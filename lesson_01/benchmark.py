@@ -0,0 +1,139 @@
+"""
+Замеры sync/threads/processes/asyncio на нагрузках из lesson_01.
+
+IO-нагрузка - GET-запрос к локальному StubServer вместо api.covidtracking.com,
+CPU-нагрузка - цикл count из cpu_op_sync.
+Режим pool сравнивает переиспользуемый WorkerPool с запуском процесса на каждую задачу (processes).
+
+Пример:
+    python benchmark.py --fanout 50 --repeat 7 --output results.json
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from multiprocessing import Process
+from threading import Thread
+from typing import Callable, Optional
+
+import requests
+
+from cpu_op_sync import count
+from io_op_asyncio import IN_FLIGHT_LIMIT, main as fetch_all
+from process_pool import WorkerPool
+from stats import summarize
+from stub_server import StubServer
+
+CASES = ('io', 'cpu')
+MODES = ('sync', 'threads', 'processes', 'pool', 'asyncio')
+
+
+def fetch(url: str) -> int:
+    return requests.get(url).status_code
+
+
+def run_sync(func: Callable, args: list[tuple]):
+    for item in args:
+        func(*item)
+
+
+def run_threads(func: Callable, args: list[tuple]):
+    threads = [Thread(target=func, args=item) for item in args]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def run_processes(func: Callable, args: list[tuple]):
+    processes = [Process(target=func, args=item) for item in args]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+
+async def _count_all(limit: int, fanout: int):
+    async def count_one():
+        return count(limit)
+    await asyncio.gather(*[count_one() for _ in range(fanout)])
+
+
+def make_workload(case: str, mode: str, fanout: int, url: str, limit: int,
+                  pool: Optional[WorkerPool] = None, in_flight: int = IN_FLIGHT_LIMIT) -> Callable[[], None]:
+    if mode == 'pool':
+        if case == 'io':
+            return lambda: pool.map(fetch, [url] * fanout)
+        return lambda: pool.map(count, [limit] * fanout)
+
+    if mode == 'asyncio':
+        if case == 'io':
+            return lambda: asyncio.run(fetch_all(fanout, in_flight, url))
+        return lambda: asyncio.run(_count_all(limit, fanout))
+
+    runner = {'sync': run_sync, 'threads': run_threads, 'processes': run_processes}[mode]
+    if case == 'io':
+        return lambda: runner(fetch, [(url,)] * fanout)
+    return lambda: runner(count, [(limit,)] * fanout)
+
+
+def measure(workload: Callable[[], None], warmup: int, repeat: int) -> list[float]:
+    for _ in range(warmup):
+        workload()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        workload()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cases', nargs='+', choices=CASES, default=list(CASES))
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES))
+    parser.add_argument('--fanout', type=int, nargs='+', default=[10], help='количество задач в одном прогоне')
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--delay', type=float, default=0.05, help='задержка ответа StubServer, секунды')
+    parser.add_argument('--limit', type=int, default=1_000_000, help='размер CPU-цикла count')
+    parser.add_argument('--workers', type=int, help='процессов в WorkerPool, по умолчанию по числу ядер')
+    parser.add_argument('--chunksize', type=int, default=1, help='размер пачки задач для WorkerPool')
+    parser.add_argument('--in-flight', type=int, default=IN_FLIGHT_LIMIT, help='максимум запросов в полете для asyncio')
+    parser.add_argument('--output', help='файл для JSON-отчета, по умолчанию stdout')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = []
+    with StubServer(delay=args.delay) as server:
+        for case in args.cases:
+            for fanout in args.fanout:
+                for mode in args.modes:
+                    pool = WorkerPool(args.workers, args.chunksize) if mode == 'pool' else None
+                    workload = make_workload(case, mode, fanout, server.url, args.limit, pool, args.in_flight)
+                    try:
+                        samples = measure(workload, args.warmup, args.repeat)
+                    finally:
+                        if pool:
+                            pool.shutdown()
+                    results.append({'case': case, 'mode': mode, 'fanout': fanout, **summarize(samples)})
+                    print(f'{case:<4} {mode:<10} fanout={fanout:<6} median={results[-1]["median"]:.4f}s',
+                          file=sys.stderr)
+
+    report = {
+        'config': {key: value for key, value in vars(args).items() if key != 'output'},
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as fd:
+            json.dump(report, fd, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
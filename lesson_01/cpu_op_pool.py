@@ -0,0 +1,14 @@
+from io_op_sync import time_analyzer
+from cpu_op_sync import countdown
+from process_pool import WorkerPool
+
+
+@time_analyzer
+def main():
+    with WorkerPool() as pool:
+        pool.map(countdown, range(1, 11))
+    print('Finaly')
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,20 @@
 from io_op_sync import time_analyzer
 
+COUNT_LIMIT = 5_000_000
+
+
+def count(limit: int = COUNT_LIMIT):
+    """CPU-нагрузка: пустой цикл до limit"""
+    i = 0
+    while i < limit:
+        i += 1
+    return i
+
 
 @time_analyzer
 def countdown(number):
     print(f'Start {number} function')
-    i = 0
-    while i < 5_000_000:
-        i += 1
+    count()
     print(f'Finished {number} function')
 
 
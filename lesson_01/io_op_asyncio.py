@@ -0,0 +1,85 @@
+import argparse
+import asyncio
+import json
+import time
+from typing import Optional
+
+import aiohttp
+
+from io_op_sync import URL
+from stats import summarize
+from stub_server import StubServer
+
+IN_FLIGHT_LIMIT = 100
+
+
+async def send_request(session: aiohttp.ClientSession, url: str, number=None, verbose: bool = False) -> float:
+    """Функция для отправки простого get-запроса через общий пул соединений, возвращает время ответа"""
+    if verbose:
+        print(f'Send {number} request' if number else 'Send request')
+    start_time = time.perf_counter()
+    async with session.get(url) as response:
+        await response.read()
+    if verbose:
+        print(f'Status code: {response.status}')
+    response.raise_for_status()
+    return time.perf_counter() - start_time
+
+
+async def main(count: int = 10, limit: int = IN_FLIGHT_LIMIT, url: str = URL, verbose: bool = False) -> dict:
+    """
+    Отправляет count запросов, одновременно в полете не больше limit.
+    Запросы выполняют limit воркеров на одном TCPConnector, поэтому соединения переиспользуются,
+    а память не растет с count.
+    """
+    numbers = iter(range(1, count + 1))
+    latencies = []
+    errors = 0
+
+    async def worker(session: aiohttp.ClientSession):
+        nonlocal errors
+        for number in numbers:
+            try:
+                latencies.append(await send_request(session, url, number, verbose))
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                errors += 1
+
+    connector = aiohttp.TCPConnector(limit=limit, limit_per_host=limit, ttl_dns_cache=300)
+    start_time = time.perf_counter()
+    async with aiohttp.ClientSession(connector=connector) as session:
+        await asyncio.gather(*[worker(session) for _ in range(min(limit, count))])
+    elapsed = time.perf_counter() - start_time
+
+    return {
+        'requests': count,
+        'errors': errors,
+        'in_flight_limit': limit,
+        'elapsed': elapsed,
+        'throughput': len(latencies) / elapsed if elapsed else 0.0,
+        'latency': summarize(latencies) if latencies else None,
+    }
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--count', type=int, default=10)
+    parser.add_argument('--limit', type=int, default=IN_FLIGHT_LIMIT, help='максимум запросов в полете')
+    parser.add_argument('--url', help='по умолчанию запросы идут в локальный StubServer')
+    parser.add_argument('--delay', type=float, default=0.05, help='задержка ответа StubServer, секунды')
+    parser.add_argument('--verbose', action='store_true')
+    return parser.parse_args(argv)
+
+
+def run(argv=None) -> Optional[dict]:
+    args = parse_args(argv)
+    if args.url:
+        report = asyncio.run(main(args.count, args.limit, args.url, args.verbose))
+    else:
+        with StubServer(delay=args.delay) as server:
+            report = asyncio.run(main(args.count, args.limit, server.url, args.verbose))
+    print(json.dumps(report, indent=2))
+    return report
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,14 @@
+from functools import partial
+
+from io_op_sync import send_request, time_analyzer, URL
+from process_pool import WorkerPool
+
+
+@time_analyzer
+def main():
+    with WorkerPool(workers=10) as pool:
+        pool.map(partial(send_request, URL), range(1, 11))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,17 @@
 import requests
 import time
+from functools import wraps
 
 URL = 'https://api.covidtracking.com/v1/us/current.json'
 
 
 def time_analyzer(func):
     """Декоратор для расчёта времени выполнения функции"""
+    @wraps(func)
     def wrapper(*args, **kwargs):
-        start_time = time.time()
+        start_time = time.perf_counter()
         result = func(*args, **kwargs)
-        delta_time = time.time() - start_time
+        delta_time = time.perf_counter() - start_time
         print(f'Execution time: {delta_time}\n')
         return result
     return wrapper
@@ -0,0 +1,68 @@
+import asyncio
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Callable, Iterable, Optional
+
+
+def _run_chunk(func: Callable, chunk: list) -> list:
+    return [func(item) for item in chunk]
+
+
+def _split(items: list, chunksize: int) -> list[list]:
+    return [items[i:i + chunksize] for i in range(0, len(items), chunksize)]
+
+
+class WorkerPool:
+    """
+    Переиспользуемый пул процессов для CPU-задач вроде countdown.
+    Процессы запускаются один раз, задачи отправляются пачками по chunksize,
+    чтобы не платить за запуск процесса и передачу данных на каждый элемент.
+    """
+
+    def __init__(self, workers: Optional[int] = None, chunksize: int = 1):
+        self.workers = workers or os.cpu_count() or 1
+        self.chunksize = chunksize
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.__exit__(exc_type, exc_val, exc_tb)
+
+    def start(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+
+    def shutdown(self, wait: bool = True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        self.start()
+        return self._executor
+
+    def submit(self, func: Callable, *args) -> Future:
+        return self.executor.submit(func, *args)
+
+    def map(self, func: Callable, items: Iterable, chunksize: Optional[int] = None) -> list:
+        return list(self.executor.map(func, items, chunksize=chunksize or self.chunksize))
+
+    async def run(self, func: Callable, *args) -> Any:
+        """Выполняет func в пуле и позволяет дождаться результата из event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    async def map_async(self, func: Callable, items: Iterable, chunksize: Optional[int] = None) -> list:
+        chunks = _split(list(items), chunksize or self.chunksize)
+        results = await asyncio.gather(*[self.run(_run_chunk, func, chunk) for chunk in chunks])
+        return [item for chunk in results for item in chunk]
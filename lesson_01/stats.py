@@ -0,0 +1,24 @@
+import statistics
+
+
+def percentile(samples: list[float], fraction: float) -> float:
+    """Перцентиль с линейной интерполяцией между соседними значениями"""
+    ordered = sorted(samples)
+    position = (len(ordered) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize(samples: list[float]) -> dict:
+    """Сводка по замерам в секундах: медиана, p95/p99, стандартное отклонение"""
+    return {
+        'runs': len(samples),
+        'min': min(samples),
+        'max': max(samples),
+        'mean': statistics.fmean(samples),
+        'median': statistics.median(samples),
+        'p95': percentile(samples, 0.95),
+        'p99': percentile(samples, 0.99),
+        'stdev': statistics.stdev(samples) if len(samples) > 1 else 0.0,
+    }
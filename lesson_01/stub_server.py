@@ -0,0 +1,71 @@
+import asyncio
+import threading
+from typing import Optional
+
+from aiohttp import web
+
+PATH = '/v1/us/current.json'
+PAYLOAD = [{'date': 20210307, 'states': 56, 'positive': 28756489, 'death': 515151}]
+
+
+class StubServer:
+    """
+    Локальная замена api.covidtracking.com для замеров без сети.
+    Сервер работает в отдельном потоке со своим event loop и отвечает с задержкой delay секунд.
+    """
+
+    def __init__(self, delay: float = 0.05, host: str = '127.0.0.1', port: int = 0):
+        self.delay = delay
+        self.host = host
+        self.port = port
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._runner: Optional[web.AppRunner] = None
+        self._started = threading.Event()
+
+    @property
+    def url(self) -> str:
+        return f'http://{self.host}:{self.port}{PATH}'
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        await asyncio.sleep(self.delay)
+        return web.json_response(PAYLOAD)
+
+    async def _start_app(self):
+        app = web.Application()
+        app.router.add_get(PATH, self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port, backlog=1024)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        self._loop.run_until_complete(self._start_app())
+        self._started.set()
+        self._loop.run_forever()
+        self._loop.run_until_complete(self._runner.cleanup())
+        self._loop.close()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self._started.wait()
+
+    def stop(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+if __name__ == '__main__':
+    with StubServer() as server:
+        print(f'Serving on {server.url}')
+        threading.Event().wait()
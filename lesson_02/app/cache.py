@@ -0,0 +1,89 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Tuple
+
+from app.const import OFFERS_CACHE_TTL, OFFERS_CACHE_SIZE
+from app.offers import OfferStore
+
+
+class OffersCache:
+    """
+    Кеш предложений по source с TTL и вытеснением давно не используемых (LRU).
+    Одновременные запросы одного source, которого нет в кеше, ждут один общий запрос к сервису.
+    Для записи кеша лениво строится один OfferStore (get_store), его индексы переиспользуются
+    всеми запросами, пока запись жива.
+    """
+
+    def __init__(self, ttl: float = OFFERS_CACHE_TTL, maxsize: int = OFFERS_CACHE_SIZE,
+                 clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._clock = clock
+        self._items: OrderedDict[str, Tuple[float, list[dict]]] = OrderedDict()
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        self._stores: Dict[str, OfferStore] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    async def get(self, source: str, loader: Callable[[str], Awaitable[list[dict]]]) -> list[dict]:
+        return list(await self._get(source, loader))
+
+    async def get_store(self, source: str, loader: Callable[[str], Awaitable[list[dict]]]) -> OfferStore:
+        """OfferStore по предложениям source, строится один раз на запись кеша"""
+        offers = await self._get(source, loader)
+        store = self._stores.get(source)
+        if store is None or store.offers is not offers:
+            store = OfferStore(offers)
+            entry = self._items.get(source)
+            if entry is not None and entry[1] is offers:
+                self._stores[source] = store
+        return store
+
+    async def _get(self, source: str, loader: Callable[[str], Awaitable[list[dict]]]) -> list[dict]:
+        entry = self._items.get(source)
+        if entry is not None:
+            expires_at, offers = entry
+            if expires_at > self._clock():
+                self.hits += 1
+                self._items.move_to_end(source)
+                return offers
+            del self._items[source]
+            self._stores.pop(source, None)
+
+        task = self._in_flight.get(source)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = asyncio.ensure_future(loader(source))
+            task.add_done_callback(lambda done: self._on_loaded(source, done))
+            self._in_flight[source] = task
+        # shield: отмена одного из ожидающих не отменяет общий запрос для остальных
+        return await asyncio.shield(task)
+
+    def _on_loaded(self, source: str, task: asyncio.Task):
+        self._in_flight.pop(source, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        self._items[source] = (self._clock() + self.ttl, task.result())
+        self._items.move_to_end(source)
+        while len(self._items) > self.maxsize:
+            evicted, _ = self._items.popitem(last=False)
+            self._stores.pop(evicted, None)
+
+    def clear(self):
+        self._items.clear()
+        self._stores.clear()
+
+    def stats(self) -> dict:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'size': len(self._items),
+            'stores': len(self._stores),
+            'in_flight': len(self._in_flight),
+        }
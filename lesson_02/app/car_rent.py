@@ -1,9 +1,16 @@
 import asyncio
+import time
 from asyncio import Queue, Event
-from collections import defaultdict
-from typing import Optional, Any, Dict, Set
+from functools import partial
+from typing import Optional, Any, AsyncIterator, Awaitable, Callable, Dict, List, Set, Union
 
-from app.const import MAX_PARALLEL_AGG_REQUESTS_COUNT, WORKERS_COUNT
+from app.cache import OffersCache
+from app.metrics import PipelineMetrics
+from app.offers import OfferSet, OfferStore
+from app.reservations import ReservationStore
+from app.const import (
+    MAX_PARALLEL_AGG_REQUESTS_COUNT, WORKERS_COUNT, FILTER_WORKERS_COUNT, QUEUE_SIZE, HEDGE_DELAY, HEDGE_MAX_BACKUPS
+)
 
 
 class PipelineContext:
@@ -17,8 +24,16 @@ class PipelineContext:
 
 
 CURRENT_AGG_REQUESTS_COUNT = 0
-BOOKED_CARS: Dict[int, Set[str]] = defaultdict(set)
+RESERVATIONS = ReservationStore()
+# user_id -> url забронированных авто, индекс поверх RESERVATIONS
+BOOKED_CARS: Dict[int, Set[str]] = RESERVATIONS.users
 IS_RUNNING = False
+# конвейер, запущенный через run_pipeline, его можно остановить через PIPELINE.stop
+PIPELINE: Optional['Pipeline'] = None
+
+
+def is_running_global() -> bool:
+    return IS_RUNNING
 
 
 async def get_offers(source: str) -> list[dict]:
@@ -39,21 +54,27 @@ async def get_offers(source: str) -> list[dict]:
     ]
 
 
-async def get_offers_from_sourses(sources: list[str]) -> list[dict]:
+async def get_offers_from_sourses(
+        sources: list[str],
+        cache: Optional[OffersCache] = None,
+) -> Union[list[dict], OfferSet]:
     """
     Эта функция агрегирует предложения из списка сервисов по каршерингу
 
     Keyword arguments:
     sources - список сайтов каршеринга ["yandex", "belka", "delimobil"]
+    cache - кеш предложений, при наличии запросы к сервисам идут через него и результат - OfferSet (get_offer_set)
     """
+    if cache is not None:
+        return await get_offer_set(sources, cache)
 
+    # количество параллельных вызовов ограничивает семафор звена, здесь только счетчик текущих запросов
     global CURRENT_AGG_REQUESTS_COUNT
-    if CURRENT_AGG_REQUESTS_COUNT >= MAX_PARALLEL_AGG_REQUESTS_COUNT:
-        await asyncio.sleep(10.0)
-
     CURRENT_AGG_REQUESTS_COUNT += 1
-    result = await asyncio.gather(*[get_offers(source) for source in sources])
-    CURRENT_AGG_REQUESTS_COUNT -= 1
+    try:
+        result = await asyncio.gather(*[get_offers(source) for source in sources])
+    finally:
+        CURRENT_AGG_REQUESTS_COUNT -= 1
 
     out = list()
     for item in result:
@@ -62,7 +83,87 @@ async def get_offers_from_sourses(sources: list[str]) -> list[dict]:
     return out
 
 
-async def chain_combine_service_offers(inbound: Queue[PipelineContext], outbound: Queue[PipelineContext], **kw):
+async def get_offer_set(sources: list[str], cache: OffersCache) -> OfferSet:
+    """
+    То же, что get_offers_from_sourses, но через кеш и без объединения списков:
+    для каждого сервиса отдается OfferStore записи кеша, индексы которого строятся один раз на TTL.
+    """
+    global CURRENT_AGG_REQUESTS_COUNT
+    CURRENT_AGG_REQUESTS_COUNT += 1
+    try:
+        stores = await asyncio.gather(*[cache.get_store(source, get_offers) for source in sources])
+    finally:
+        CURRENT_AGG_REQUESTS_COUNT -= 1
+    return OfferSet(list(stores))
+
+
+async def iter_offers_from_sources(
+        sources: list[str],
+        source_timeout: Optional[float] = None,
+        cache: Optional[OffersCache] = None,
+) -> AsyncIterator[list[dict]]:
+    """
+    Отдает предложения каждого сервиса по мере получения, не дожидаясь самого медленного.
+    Сервис, не ответивший за source_timeout секунд, пропускается.
+    Если перебор прерван раньше, оставшиеся запросы отменяются.
+    """
+    async def load(source: str) -> list[dict]:
+        request = cache.get(source, get_offers) if cache is not None else get_offers(source)
+        return await asyncio.wait_for(request, source_timeout)
+
+    tasks = [asyncio.ensure_future(load(source)) for source in sources]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            try:
+                yield await next_done
+            except asyncio.TimeoutError:
+                continue
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def get_offers_streaming(
+        sources: list[str],
+        source_timeout: Optional[float] = None,
+        min_offers: Optional[int] = None,
+        accept: Optional[Callable[[dict], bool]] = None,
+        cache: Optional[OffersCache] = None,
+) -> list[dict]:
+    """
+    Собирает предложения по мере ответа сервисов и возвращает их, как только набралось
+    min_offers подходящих (accept) предложений, остальные запросы отменяются.
+    Без min_offers ждет все сервисы, но не дольше source_timeout на каждый.
+    """
+    global CURRENT_AGG_REQUESTS_COUNT
+    CURRENT_AGG_REQUESTS_COUNT += 1
+    out = list()
+    accepted = 0
+    stream = iter_offers_from_sources(sources, source_timeout, cache)
+    try:
+        async for offers in stream:
+            out.extend(offers)
+            if min_offers:
+                accepted += len(offers) if accept is None else sum(1 for offer in offers if accept(offer))
+                if accepted >= min_offers:
+                    break
+    finally:
+        await stream.aclose()
+        CURRENT_AGG_REQUESTS_COUNT -= 1
+    return out
+
+
+async def chain_combine_service_offers(
+        inbound: Queue[PipelineContext],
+        outbound: Queue[PipelineContext],
+        workers_count: int = WORKERS_COUNT,
+        max_parallel_requests: int = MAX_PARALLEL_AGG_REQUESTS_COUNT,
+        is_running: Callable[[], bool] = is_running_global,
+        fetch_offers: Callable[[list[str]], Awaitable[list[dict]]] = get_offers_from_sourses,
+        metrics: Optional[PipelineMetrics] = None,
+        **kw,
+):
     """
     Запускает N функций worker-ов для обработки данных из очереди inbound и передачи результата в outbound очередь.
     N worker-ов == WORKERS_COUNT (константа из app/const.py)
@@ -73,9 +174,15 @@ async def chain_combine_service_offers(inbound: Queue[PipelineContext], outbound
 
     Keyword arguments:
     inbound: Queue[PipelineContext] - очередь данных для обработки
+    workers_count: int - количество воркеров звена
+    max_parallel_requests: int - ограничение параллельных вызовов get_offers_from_sourses
+    is_running: Callable[[], bool] - пока возвращает True, воркеры берут новые элементы
+    fetch_offers: Callable - функция получения предложений по списку сервисов
+    metrics: Optional[PipelineMetrics] - метрики конвейера, звено пишет их как "combine"
     """
-    sem = asyncio.Semaphore(MAX_PARALLEL_AGG_REQUESTS_COUNT)
-    tasks = [asyncio.Task(get_offers_worker(sem, inbound, outbound)) for _ in range(WORKERS_COUNT)]
+    sem = asyncio.Semaphore(max_parallel_requests)
+    tasks = [asyncio.Task(get_offers_worker(sem, inbound, outbound, is_running, fetch_offers, metrics))
+             for _ in range(workers_count)]
     try:
         await asyncio.gather(*tasks)
     except asyncio.CancelledError:
@@ -85,23 +192,49 @@ async def chain_combine_service_offers(inbound: Queue[PipelineContext], outbound
         print('chain_combine_service_offers cancelled')
 
 
-async def get_offers_worker(sem: asyncio.Semaphore, inbound: Queue[PipelineContext], outbound: Queue[PipelineContext]):
+async def get_offers_worker(
+        sem: asyncio.Semaphore,
+        inbound: Queue[PipelineContext],
+        outbound: Queue[PipelineContext],
+        is_running: Callable[[], bool] = is_running_global,
+        fetch_offers: Callable[[list[str]], Awaitable[list[dict]]] = get_offers_from_sourses,
+        metrics: Optional[PipelineMetrics] = None,
+):
     """Функция-воркер для обработки элементов из очереди при опросе сервисов"""
+    stage = metrics.stage('combine') if metrics else None
     try:
-        while IS_RUNNING:
+        while is_running():
             item = await inbound.get()
-            async with sem:
-                item.data = await get_offers_from_sourses(item.data)
-            await outbound.put(item)
+            try:
+                start = time.perf_counter()
+                async with sem:
+                    if metrics:
+                        metrics.semaphore_wait.observe(time.perf_counter() - start)
+                    item.data = await fetch_offers(item.data)
+                if stage:
+                    stage.observe(time.perf_counter() - start)
+                await outbound.put(item)
+            finally:
+                inbound.task_done()
     except asyncio.CancelledError:
         print('get_offers_worker canceled')
 
 
+def make_offer_filter(brand: Optional[str] = None, price: Optional[int] = None) -> Callable[[dict], bool]:
+    """Условие фильтра предложений: brand == offer["brand"] и price >= offer["price"], если они заданы"""
+    def accept(element: dict) -> bool:
+        return (not brand or element.get('brand') == brand) and (not price or element.get('price') <= price)
+    return accept
+
+
 async def chain_filter_offers(
         inbound: Queue,
         outbound: Queue,
         brand: Optional[str] = None,
         price: Optional[int] = None,
+        workers_count: int = FILTER_WORKERS_COUNT,
+        is_running: Callable[[], bool] = is_running_global,
+        metrics: Optional[PipelineMetrics] = None,
         **kw,
 ):
     """
@@ -114,53 +247,116 @@ async def chain_filter_offers(
 
     inbound: Queue[PipelineContext] - очередь данных для обработки
     """
+    tasks = [asyncio.Task(filter_offers_worker(inbound, outbound, brand, price, is_running, metrics))
+             for _ in range(workers_count)]
     try:
-        while IS_RUNNING:
-            item = await inbound.get()
-            item.data = [element for element in item.data if
-                         (not brand or element.get('brand') == brand)
-                         and (not price or element.get('price') <= price)]
-            await outbound.put(item)
+        await asyncio.gather(*tasks)
     except asyncio.CancelledError:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks)
         print('chain_filter_offers cancelled')
 
 
-async def cancel_book_request(user_id: int, offer: dict):
+async def filter_offers_worker(
+        inbound: Queue[PipelineContext],
+        outbound: Queue[PipelineContext],
+        brand: Optional[str] = None,
+        price: Optional[int] = None,
+        is_running: Callable[[], bool] = is_running_global,
+        metrics: Optional[PipelineMetrics] = None,
+):
+    """
+    Функция-воркер для фильтрации предложений.
+    Если в item.data лежит OfferSet из кеша (или OfferStore), фильтр выполняется запросом к их индексам.
+    """
+    accept = make_offer_filter(brand, price)
+    stage = metrics.stage('filter') if metrics else None
+    try:
+        while is_running():
+            item = await inbound.get()
+            try:
+                start = time.perf_counter()
+                if isinstance(item.data, (OfferSet, OfferStore)):
+                    item.data = item.data.filter(brand, price)
+                else:
+                    item.data = [element for element in item.data if accept(element)]
+                if stage:
+                    stage.observe(time.perf_counter() - start)
+                await outbound.put(item)
+            finally:
+                inbound.task_done()
+    except asyncio.CancelledError:
+        print('filter_offers_worker cancelled')
+
+
+async def cancel_book_request(user_id: int, offer: dict, reservations: Optional[ReservationStore] = None,
+                              token: Optional[int] = None):
     """
     Эмулирует запрос отмены бронирования  авто
+    token - токен claim отменяемого запроса, бронь, созданная не им, не снимается
     """
     await asyncio.sleep(1)
-    BOOKED_CARS[user_id].remove(offer.get("url"))
+    if reservations is None:
+        reservations = RESERVATIONS
+    await reservations.release(offer.get("url"), user_id, token)
     print('book_request cancelled')
 
 
-async def book_request(user_id: int, offer: dict, event: Event) -> dict:
+async def book_request(user_id: int, offer: dict, event: Event,
+                       reservations: Optional[ReservationStore] = None) -> Optional[dict]:
     """
     Эмулирует запрос бронирования авто. В случае отмены вызывает cancel_book_request.
+    Если авто уже забронировано другим пользователем, возвращает None.
+    Пока запрос идет, бронь временная (RESERVATION_TTL), выигравшая бронь подтверждается и больше не истекает.
     """
+    if reservations is None:
+        reservations = RESERVATIONS
+    token = None
     try:
-        BOOKED_CARS[user_id].add(offer.get("url"))
+        token = await reservations.claim(offer.get("url"), user_id)
+        if token is None:
+            return None
         await asyncio.sleep(1)
         if event.is_set():
             event.clear()
         else:
             await event.wait()
+        if not await reservations.confirm(offer.get("url"), user_id):
+            return None
         return offer
     except asyncio.CancelledError:
-        await cancel_book_request(user_id, offer)
-
-
-async def chain_book_car(inbound: Queue[PipelineContext], outbound: Queue[PipelineContext], **kw):
+        if token is not None:
+            await cancel_book_request(user_id, offer, reservations, token)
+
+
+async def chain_book_car(
+        inbound: Queue[PipelineContext],
+        outbound: Queue[PipelineContext],
+        workers_count: int = WORKERS_COUNT,
+        is_running: Callable[[], bool] = is_running_global,
+        hedge_delay: float = HEDGE_DELAY,
+        max_backups: int = HEDGE_MAX_BACKUPS,
+        reservations: Optional[ReservationStore] = None,
+        metrics: Optional[PipelineMetrics] = None,
+        **kw,
+):
     """
     Запускает N функций worker-ов для обработки данных из очереди inbound и передачи результата в outbound очередь.
-    Worker должен параллельно вызвать book_request для каждого предложения.
+    Worker бронирует предложения по стратегии book_hedged: сначала самое дешевое,
+    резервные попытки - только если бронирование затянулось.
     Первый отработавший запрос передать в PipelineContext.
     Остальные запросы нужно отменить и вызвать для них cancel_book_request.
 
     Keyword arguments:
     inbound: Queue[PipelineContext] - очередь данных для обработки
+    hedge_delay: float - через сколько секунд без ответа запускать резервную попытку
+    max_backups: int - сколько резервных попыток может идти одновременно с основной
+    reservations: Optional[ReservationStore] - хранилище бронирований, по умолчанию общее RESERVATIONS
     """
-    tasks = [asyncio.Task(book_car_worker(inbound, outbound)) for _ in range(WORKERS_COUNT)]
+    tasks = [asyncio.Task(book_car_worker(inbound, outbound, is_running, hedge_delay, max_backups, reservations,
+                                          metrics))
+             for _ in range(workers_count)]
     try:
         await asyncio.gather(*tasks)
     except asyncio.CancelledError:
@@ -170,32 +366,81 @@ async def chain_book_car(inbound: Queue[PipelineContext], outbound: Queue[Pipeli
         print('chain_book_car cancelled')
 
 
-async def book_car_worker(inbound: Queue[PipelineContext], outbound: Queue[PipelineContext]):
+async def book_car_worker(
+        inbound: Queue[PipelineContext],
+        outbound: Queue[PipelineContext],
+        is_running: Callable[[], bool] = is_running_global,
+        hedge_delay: float = HEDGE_DELAY,
+        max_backups: int = HEDGE_MAX_BACKUPS,
+        reservations: Optional[ReservationStore] = None,
+        metrics: Optional[PipelineMetrics] = None,
+):
     """Функция-воркер для обработки элементов из очереди при бронировании машины"""
-    tasks = list()
+    stage = metrics.stage('book') if metrics else None
     try:
-        while IS_RUNNING:
-            event = Event()
-            event.set()
+        while is_running():
             item = await inbound.get()
-            tasks = [asyncio.Task(book_request(item.user_id, element, event)) for element in item.data]
-            result, pending = await asyncio.wait(
-                tasks,
-                return_when='FIRST_COMPLETED')
-            item.data = result.pop().result()
+            try:
+                start = time.perf_counter()
+                item.data = await book_hedged(item.user_id, item.data, hedge_delay, max_backups, reservations)
+                if stage:
+                    stage.observe(time.perf_counter() - start)
+                await outbound.put(item)
+            finally:
+                inbound.task_done()
 
-            for task in pending:
-                task.cancel()
-            await asyncio.gather(*pending)
+    except asyncio.CancelledError:
+        print('book_car_worker cancelled')
 
-            await outbound.put(item)
 
-    except asyncio.CancelledError:
+async def book_hedged(
+        user_id: int,
+        offers: list[dict],
+        hedge_delay: float = HEDGE_DELAY,
+        max_backups: int = HEDGE_MAX_BACKUPS,
+        reservations: Optional[ReservationStore] = None,
+) -> Optional[dict]:
+    """
+    Бронирует одно авто из offers, начиная с самого дешевого.
+    Если попытка не завершилась за hedge_delay секунд, запускается следующая по цене,
+    одновременно идет не больше 1 + max_backups попыток. Неудачная попытка (в том числе авто,
+    уже забронированное другим пользователем) сразу заменяется следующей.
+    Первое успешное бронирование возвращается, остальные попытки отменяются (cancel_book_request).
+    """
+    event = Event()
+    event.set()
+    candidates = iter(sorted(offers, key=lambda offer: offer.get('price')))
+    tasks = set()
+
+    def launch() -> bool:
+        offer = next(candidates, None)
+        if offer is None:
+            return False
+        tasks.add(asyncio.create_task(book_request(user_id, offer, event, reservations)))
+        return True
+
+    winner = None
+    try:
+        while winner is None and (tasks or launch()):
+            done, _ = await asyncio.wait(tasks, timeout=hedge_delay, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                if len(tasks) <= max_backups:
+                    launch()
+                continue
+            for task in done:
+                tasks.discard(task)
+                if winner is None and not task.cancelled() and task.exception() is None:
+                    winner = task.result()
+            # неудачные попытки заменяются следующими сразу, не дожидаясь hedge_delay
+            if winner is None:
+                for _ in done:
+                    if len(tasks) > max_backups or not launch():
+                        break
+    finally:
         for task in tasks:
-            if not task.done():
-                task.cancel()
-        await asyncio.gather(*tasks)
-        print('book_car_worker cancelled')
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return winner
 
 
 async def stop_program(event: Event):
@@ -206,6 +451,145 @@ async def stop_program(event: Event):
     print('IS_RUNNING', IS_RUNNING)
 
 
+class Pipeline:
+    """
+    Конвейер chain_combine_service_offers -> chain_filter_offers -> chain_book_car.
+    Владеет звеньями и ограниченными очередями между ними: когда звено не успевает,
+    put в его очередь ждет, и предыдущие звенья притормаживают. Выходная очередь ограничивается только
+    через outbound_size.
+    У каждого экземпляра свое состояние, поэтому в одном процессе можно запустить несколько конвейеров.
+    """
+
+    def __init__(
+            self,
+            combine_workers: int = WORKERS_COUNT,
+            filter_workers: int = FILTER_WORKERS_COUNT,
+            book_workers: int = WORKERS_COUNT,
+            max_parallel_requests: int = MAX_PARALLEL_AGG_REQUESTS_COUNT,
+            queue_size: int = QUEUE_SIZE,
+            outbound_size: int = 0,
+            brand: Optional[str] = None,
+            price: Optional[int] = None,
+            cache: Optional[OffersCache] = None,
+            source_timeout: Optional[float] = None,
+            min_offers: Optional[int] = None,
+            hedge_delay: float = HEDGE_DELAY,
+            max_backups: int = HEDGE_MAX_BACKUPS,
+            reservations: Optional[ReservationStore] = None,
+            metrics: Optional[PipelineMetrics] = None,
+            metrics_interval: Optional[float] = None,
+            metrics_callback: Callable[[dict], None] = print,
+            name: str = 'pipeline',
+            is_running: Optional[Callable[[], bool]] = None,
+    ):
+        self.combine_workers = combine_workers
+        self.filter_workers = filter_workers
+        self.book_workers = book_workers
+        self.max_parallel_requests = max_parallel_requests
+        self.queue_size = queue_size
+        # outbound по умолчанию не ограничен: результаты часто читают только после окончания работы
+        self.outbound_size = outbound_size
+        self.brand = brand
+        self.price = price
+        self.cache = cache
+        # потоковый режим: таймаут на каждый сервис и отсечка по количеству подходящих предложений
+        self.source_timeout = source_timeout
+        self.min_offers = min_offers
+        self.hedge_delay = hedge_delay
+        self.max_backups = max_backups
+        self.reservations = reservations
+        # метрики собираются всегда, metrics_interval включает периодическую выдачу snapshot в metrics_callback
+        self.metrics = metrics if metrics is not None else PipelineMetrics()
+        self.metrics_interval = metrics_interval
+        self.metrics_callback = metrics_callback
+        self.name = name
+        # внешний флаг работы, например is_running_global, проверяется вместе с собственным
+        self._external_is_running = is_running
+
+        self.is_running = False
+        self.inbound: Optional[Queue[PipelineContext]] = None
+        self.outbound: Optional[Queue[PipelineContext]] = None
+        self._queues: List[Queue[PipelineContext]] = []
+        self._tasks: List[asyncio.Task] = []
+
+    def _is_running(self) -> bool:
+        if self._external_is_running is not None and not self._external_is_running():
+            return False
+        return self.is_running
+
+    def _fetch_offers(self) -> Callable[[list[str]], Awaitable[list[dict]]]:
+        if self.source_timeout is None and self.min_offers is None:
+            return partial(get_offers_from_sourses, cache=self.cache)
+        return partial(
+            get_offers_streaming,
+            source_timeout=self.source_timeout,
+            min_offers=self.min_offers,
+            accept=make_offer_filter(self.brand, self.price),
+            cache=self.cache,
+        )
+
+    def start(self, inbound: Optional[Queue[PipelineContext]] = None) -> Queue[PipelineContext]:
+        """Запускает звенья и возвращает outbound очередь звена chain_book_car"""
+        self.is_running = True
+        self.inbound = inbound if inbound is not None else Queue(self.queue_size)
+        data_queue = Queue(self.queue_size)
+        filtred_queue = Queue(self.queue_size)
+        self.outbound = Queue(self.outbound_size)
+        self._queues = [self.inbound, data_queue, filtred_queue]
+        for name, queue in zip(('inbound', 'offers', 'filtred', 'outbound'), (*self._queues, self.outbound)):
+            self.metrics.watch_queue(name, queue)
+
+        self._tasks = [
+            asyncio.create_task(chain_combine_service_offers(
+                self.inbound, data_queue,
+                workers_count=self.combine_workers,
+                max_parallel_requests=self.max_parallel_requests,
+                is_running=self._is_running,
+                fetch_offers=self._fetch_offers(),
+                metrics=self.metrics,
+            ), name=f'{self.name}:offers'),
+            asyncio.create_task(chain_filter_offers(
+                data_queue, filtred_queue,
+                brand=self.brand,
+                price=self.price,
+                workers_count=self.filter_workers,
+                is_running=self._is_running,
+                metrics=self.metrics,
+            ), name=f'{self.name}:filters'),
+            asyncio.create_task(chain_book_car(
+                filtred_queue, self.outbound,
+                workers_count=self.book_workers,
+                is_running=self._is_running,
+                hedge_delay=self.hedge_delay,
+                max_backups=self.max_backups,
+                reservations=self.reservations,
+                metrics=self.metrics,
+            ), name=f'{self.name}:book_cars'),
+        ]
+        if self.metrics_interval:
+            self._tasks.append(asyncio.create_task(
+                self.metrics.run_reporter(self.metrics_interval, self.metrics_callback), name=f'{self.name}:metrics'
+            ))
+        return self.outbound
+
+    async def put(self, item: PipelineContext):
+        await self.inbound.put(item)
+
+    async def stop(self, drain: bool = True):
+        """
+        Останавливает конвейер. При drain=True сначала дожидается, пока все уже принятые элементы
+        пройдут все звенья (очередь outbound при этом должен кто-то читать), затем отменяет звенья.
+        """
+        if drain:
+            for queue in self._queues:
+                await queue.join()
+        self.is_running = False
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
 def run_pipeline(inbound: Queue[PipelineContext]) -> Queue[PipelineContext]:
     """
     Необходимо создать asyncio.Task для функций:
@@ -221,17 +605,10 @@ def run_pipeline(inbound: Queue[PipelineContext]) -> Queue[PipelineContext]:
     Keyword arguments:
     inbound: Queue[PipelineContext] - очередь данных для обработки
     """
-    global IS_RUNNING
+    global IS_RUNNING, PIPELINE
     IS_RUNNING = True
-    data_queue = Queue()
-    filtred_queue = Queue()
-    outbound = Queue()
-
-    asyncio.create_task(chain_combine_service_offers(inbound, data_queue), name='offers')
-    asyncio.create_task(chain_filter_offers(data_queue, filtred_queue), name='filters')
-    asyncio.create_task(chain_book_car(filtred_queue, outbound), name='book_cars')
-
-    return outbound
+    PIPELINE = Pipeline(is_running=is_running_global)
+    return PIPELINE.start(inbound)
 
 
 async def main():
@@ -251,4 +628,5 @@ async def main():
         print(item.user_id, item.data)
 
 
-asyncio.run(main())
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -1,5 +1,13 @@
 WORKERS_COUNT = 10
 MAX_PARALLEL_AGG_REQUESTS_COUNT = 5
+FILTER_WORKERS_COUNT = 1
+QUEUE_SIZE = 100
+OFFERS_CACHE_TTL = 1.0
+OFFERS_CACHE_SIZE = 128
+HEDGE_DELAY = 1.5
+HEDGE_MAX_BACKUPS = 2
+RESERVATION_SHARDS = 16
+RESERVATION_TTL = 15 * 60
 
 ERROR_TIMEOUT_MSG = (
     "Слишком долгое ожидание, вероятно программа повисла в бесконечном ожидании"
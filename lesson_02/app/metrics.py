@@ -0,0 +1,104 @@
+import asyncio
+import time
+from asyncio import Queue
+from bisect import bisect_left
+from typing import Callable, Dict, Optional
+
+# верхние границы корзин гистограммы, секунды
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами: observe - это bisect и пара инкрементов"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, fraction: float) -> Optional[float]:
+        """Верхняя граница корзины, в которую попадает квантиль, inf - если за последней границей"""
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.buckets[index] if index < len(self.buckets) else float('inf')
+        return float('inf')
+
+    def snapshot(self) -> dict:
+        return {
+            'count': self.count,
+            'mean': self.sum / self.count if self.count else None,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+            'buckets': dict(zip([*map(str, self.buckets), 'inf'], self.counts)),
+        }
+
+
+class StageMetrics:
+    def __init__(self, name: str, clock: Callable[[], float] = time.perf_counter):
+        self.name = name
+        self._clock = clock
+        self.started_at = clock()
+        self.processed = 0
+        self.latency = Histogram()
+
+    def observe(self, elapsed: float):
+        self.processed += 1
+        self.latency.observe(elapsed)
+
+    def snapshot(self) -> dict:
+        uptime = self._clock() - self.started_at
+        return {
+            'processed': self.processed,
+            'throughput': self.processed / uptime if uptime > 0 else 0.0,
+            'latency': self.latency.snapshot(),
+        }
+
+
+class PipelineMetrics:
+    """
+    Метрики конвейера: глубина очередей между звеньями, гистограммы времени обработки звеньев,
+    пропускная способность (элементов в секунду) и время ожидания семафора в get_offers_worker.
+    Читаются через snapshot() или периодически через run_reporter.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.perf_counter):
+        self.clock = clock
+        self.started_at = clock()
+        self.stages: Dict[str, StageMetrics] = {}
+        self.queues: Dict[str, Queue] = {}
+        self.semaphore_wait = Histogram()
+
+    def stage(self, name: str) -> StageMetrics:
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages[name] = StageMetrics(name, self.clock)
+        return stage
+
+    def watch_queue(self, name: str, queue: Queue):
+        self.queues[name] = queue
+
+    def snapshot(self) -> dict:
+        return {
+            'uptime': self.clock() - self.started_at,
+            'queues': {name: queue.qsize() for name, queue in self.queues.items()},
+            'stages': {name: stage.snapshot() for name, stage in self.stages.items()},
+            'semaphore_wait': self.semaphore_wait.snapshot(),
+        }
+
+    async def run_reporter(self, interval: float, callback: Callable[[dict], None] = print):
+        """Каждые interval секунд передает snapshot() в callback"""
+        while True:
+            await asyncio.sleep(interval)
+            callback(self.snapshot())
@@ -0,0 +1,85 @@
+from array import array
+from bisect import bisect_right
+from typing import Dict, Optional, Tuple
+
+
+class OfferStore:
+    """
+    Колоночное хранилище предложений для фильтрации по brand и price.
+    Цены лежат в array, бренды кодируются целыми числами, для каждого бренда и для всех предложений
+    хранится порядок строк, отсортированный по цене. Фильтр сводится к поиску по индексу бренда
+    и bisect по отсортированным ценам.
+    """
+
+    def __init__(self, offers: list[dict]):
+        self.offers = offers
+        self.brand_codes: Dict[str, int] = {}
+        self.prices = array('d')
+        self.brands = array('l')
+
+        rows_by_brand: Dict[int, list[int]] = {}
+        for row, offer in enumerate(offers):
+            code = self.brand_codes.setdefault(offer.get('brand'), len(self.brand_codes))
+            self.brands.append(code)
+            self.prices.append(offer.get('price'))
+            rows_by_brand.setdefault(code, []).append(row)
+
+        self._all = self._price_view(range(len(offers)))
+        self._by_brand: Dict[int, Tuple[array, array]] = {
+            code: self._price_view(rows) for code, rows in rows_by_brand.items()
+        }
+
+    def __len__(self) -> int:
+        return len(self.offers)
+
+    def _price_view(self, rows) -> Tuple[array, array]:
+        prices = self.prices
+        ordered = sorted(rows, key=prices.__getitem__)
+        return array('l', ordered), array('d', [prices[row] for row in ordered])
+
+    def select(self, brand: Optional[str] = None, price: Optional[int] = None) -> array:
+        """Номера подходящих строк в порядке возрастания цены"""
+        if brand:
+            code = self.brand_codes.get(brand)
+            if code is None:
+                return array('l')
+            rows, prices = self._by_brand[code]
+        else:
+            rows, prices = self._all
+        if not price:
+            return rows
+        return rows[:bisect_right(prices, price)]
+
+    def filter(self, brand: Optional[str] = None, price: Optional[int] = None, by_price: bool = False) -> list[dict]:
+        """
+        То же, что [offer for offer in offers if (not brand or brand == offer["brand"])
+        and (not price or price >= offer["price"])]. При by_price=True результат отсортирован по цене.
+        """
+        rows = self.select(brand, price)
+        if not by_price:
+            rows = sorted(rows)
+        offers = self.offers
+        return [offers[row] for row in rows]
+
+
+class OfferSet:
+    """
+    Предложения нескольких сервисов в виде их OfferStore, по порядку сервисов.
+    filter дает тот же результат, что фильтр объединенного списка предложений.
+    """
+
+    def __init__(self, stores: list[OfferStore]):
+        self.stores = stores
+
+    def __len__(self) -> int:
+        return sum(len(store) for store in self.stores)
+
+    def __iter__(self):
+        for store in self.stores:
+            yield from store.offers
+
+    def filter(self, brand: Optional[str] = None, price: Optional[int] = None) -> list[dict]:
+        out = []
+        for store in self.stores:
+            out.extend(store.filter(brand, price))
+        return out
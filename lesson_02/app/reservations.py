@@ -0,0 +1,119 @@
+import asyncio
+import itertools
+import math
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Set
+
+from app.const import RESERVATION_SHARDS, RESERVATION_TTL
+
+
+@dataclass
+class Reservation:
+    url: str
+    user_id: int
+    expires_at: float
+    # номер claim, создавшего бронь
+    token: int = 0
+
+
+class ReservationStore:
+    """
+    Хранилище бронирований по url авто.
+    Ключи разбиты на шарды, у каждого шарда свой lock, поэтому операции над разными авто не ждут друг друга.
+    Бронь живет ttl секунд, просроченная бронь считается свободной и удаляется при обращении или в purge_expired.
+    Подтвержденная бронь (confirm) не истекает и снимается только через release.
+    """
+
+    def __init__(self, shards: int = RESERVATION_SHARDS, ttl: float = RESERVATION_TTL,
+                 clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self._clock = clock
+        self._shards: List[Dict[str, Reservation]] = [{} for _ in range(shards)]
+        self._locks: List[asyncio.Lock] = [asyncio.Lock() for _ in range(shards)]
+        self._tokens = itertools.count(1)
+        # обратный индекс user_id -> url забронированных авто
+        self.users: Dict[int, Set[str]] = defaultdict(set)
+
+    def _index(self, url: str) -> int:
+        return hash(url) % len(self._shards)
+
+    def lock(self, url: str) -> asyncio.Lock:
+        """Lock шарда url, для составных операций над одним авто"""
+        return self._locks[self._index(url)]
+
+    def _get_alive(self, shard: Dict[str, Reservation], url: str) -> Optional[Reservation]:
+        reservation = shard.get(url)
+        if reservation is not None and reservation.expires_at <= self._clock():
+            self._drop(shard, reservation)
+            return None
+        return reservation
+
+    def _drop(self, shard: Dict[str, Reservation], reservation: Reservation):
+        del shard[reservation.url]
+        self.users[reservation.user_id].discard(reservation.url)
+
+    async def claim(self, url: str, user_id: int, ttl: Optional[float] = None) -> Optional[int]:
+        """
+        Бронирует авто за user_id и возвращает токен брони. None, если авто уже забронировано другим пользователем.
+        Существующая бронь того же пользователя не перезаписывается и не укорачивается,
+        а release с токеном этого claim ее не снимет.
+        """
+        index = self._index(url)
+        async with self._locks[index]:
+            shard = self._shards[index]
+            token = next(self._tokens)
+            expires_at = self._clock() + (self.ttl if ttl is None else ttl)
+            reservation = self._get_alive(shard, url)
+            if reservation is not None:
+                if reservation.user_id != user_id:
+                    return None
+                reservation.expires_at = max(reservation.expires_at, expires_at)
+                return token
+            shard[url] = Reservation(url, user_id, expires_at, token)
+            self.users[user_id].add(url)
+            return token
+
+    async def confirm(self, url: str, user_id: int) -> bool:
+        """Делает бронь user_id бессрочной. False, если брони нет или она принадлежит другому пользователю"""
+        index = self._index(url)
+        async with self._locks[index]:
+            reservation = self._get_alive(self._shards[index], url)
+            if reservation is None or reservation.user_id != user_id:
+                return False
+            reservation.expires_at = math.inf
+            return True
+
+    async def release(self, url: str, user_id: int, token: Optional[int] = None) -> bool:
+        """Снимает бронь, если она принадлежит user_id и, если передан token, создана этим claim"""
+        index = self._index(url)
+        async with self._locks[index]:
+            shard = self._shards[index]
+            reservation = self._get_alive(shard, url)
+            if reservation is None or reservation.user_id != user_id:
+                return False
+            if token is not None and reservation.token != token:
+                return False
+            self._drop(shard, reservation)
+            return True
+
+    def owner(self, url: str) -> Optional[int]:
+        reservation = self._get_alive(self._shards[self._index(url)], url)
+        return reservation.user_id if reservation is not None else None
+
+    def is_taken(self, url: str) -> bool:
+        return self.owner(url) is not None
+
+    def purge_expired(self) -> int:
+        """Удаляет просроченные брони, возвращает их количество"""
+        now = self._clock()
+        removed = 0
+        for shard in self._shards:
+            for reservation in [item for item in shard.values() if item.expires_at <= now]:
+                self._drop(shard, reservation)
+                removed += 1
+        return removed
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self._shards)
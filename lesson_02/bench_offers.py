@@ -0,0 +1,39 @@
+import random
+import timeit
+
+from app.car_rent import make_offer_filter
+from app.offers import OfferStore
+
+SIZES = (10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6)
+BRANDS = ('LADA', 'MITSUBISHI', 'KIA', 'DAEWOO', 'PORSCHE', 'BMW', 'AUDI', 'VOLKSWAGEN')
+QUERIES = (('KIA', 3_000), ('KIA', None), (None, 3_000))
+
+
+def make_offers(count: int) -> list[dict]:
+    return [
+        {'url': f'http://source/car?id={number}', 'price': random.randint(500, 20_000), 'brand': random.choice(BRANDS)}
+        for number in range(count)
+    ]
+
+
+def bench(func, count: int) -> float:
+    number = max(1, 100_000 // count)
+    return min(timeit.repeat(func, repeat=3, number=number)) / number * 1000
+
+
+def main():
+    print(f'{"offers":>8} {"query":<14} {"list, ms":>10} {"build, ms":>10} {"store, ms":>10}')
+    for count in SIZES:
+        offers = make_offers(count)
+        build = bench(lambda: OfferStore(offers), count)
+        store = OfferStore(offers)
+        for brand, price in QUERIES:
+            accept = make_offer_filter(brand, price)
+            assert store.filter(brand, price) == [offer for offer in offers if accept(offer)]
+            scan = bench(lambda: [offer for offer in offers if accept(offer)], count)
+            query = bench(lambda: store.filter(brand, price), count)
+            print(f'{count:>8} {f"{brand}/{price}":<14} {scan:>10.3f} {build:>10.3f} {query:>10.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+import timeit
+
+from clients.tg import decoder
+from clients.tg.dcs import GetUpdatesResponse
+
+UPDATES_COUNT = 100
+REPEAT = 5
+NUMBER = 20
+
+
+def make_response(count: int) -> dict:
+    result = []
+    for number in range(count):
+        message = {
+            'message_id': number,
+            'from': {'id': number, 'is_bot': False, 'first_name': 'Ivan', 'username': 'ivan', 'language_code': 'ru'},
+            'chat': {'id': number, 'first_name': 'Ivan', 'last_name': 'Ivanov', 'username': 'ivan', 'type': 'private'},
+            'date': 1640000000 + number,
+        }
+        if number % 2:
+            message['document'] = {
+                'file_id': f'file-{number}', 'file_unique_id': f'unique-{number}', 'file_size': 1024,
+                'file_name': 'doc.pdf', 'mime_type': 'application/pdf',
+                'thumb': {'file_id': 'thumb', 'file_unique_id': 'thumb', 'file_size': 10, 'width': 90, 'height': 90},
+            }
+        else:
+            message['text'] = '/start'
+            message['entities'] = [{'offset': 0, 'length': 6, 'type': 'bot_command'}]
+        result.append({'update_id': number, 'message': message})
+    return {'ok': True, 'result': result}
+
+
+def bench(name: str, func) -> None:
+    best = min(timeit.repeat(func, repeat=REPEAT, number=NUMBER)) / NUMBER
+    print(f'{name:<16} {best * 1000:8.3f} ms per {UPDATES_COUNT} updates')
+
+
+def main():
+    data = make_response(UPDATES_COUNT)
+    assert decoder.load(GetUpdatesResponse, data) == GetUpdatesResponse.Schema().load(data)
+
+    bench('new schema', lambda: GetUpdatesResponse.Schema().load(data))
+    bench('cached schema', lambda: decoder.load(GetUpdatesResponse, data, fast=False))
+    bench('fast decoder', lambda: decoder.load(GetUpdatesResponse, data))
+
+
+if __name__ == '__main__':
+    main()
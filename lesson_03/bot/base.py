@@ -1,26 +1,33 @@
 import asyncio
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 from bot.poller import Poller
 from bot.worker import Worker, WorkerConfig
+from clients.session import SessionPool, SessionPoolConfig
 
 
 @dataclass
 class BotConfig:
     token: str
     worker: WorkerConfig
+    session: SessionPoolConfig = field(default_factory=SessionPoolConfig)
+    # ограничение очереди апдейтов: когда воркеры не успевают, поллер перестает запрашивать новые
+    queue_size: int = 500
 
 
 class Bot:
     def __init__(self, config: BotConfig):
-        queue = asyncio.Queue()
+        queue = asyncio.Queue(maxsize=config.queue_size)
         self.poller = Poller(config.token, queue)
         self.worker = Worker(config.token, queue, config.worker)
+        self.session_config = config.session
 
     async def start(self):
+        await SessionPool.start(self.session_config)
         self.poller.start()
         self.worker.start()
 
     async def stop(self):
         await self.poller.stop()
         await self.worker.stop()
+        await SessionPool.stop()
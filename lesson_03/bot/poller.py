@@ -1,10 +1,13 @@
 import asyncio
-from typing import Optional
+import logging
+from collections import deque
+from typing import Deque, Optional
 from os import getenv
 
 from dotenv import load_dotenv
 
-from clients.tg.api import TgClient
+from clients.tg.api import TgClient, TgClientError
+from clients.tg.dcs import UpdateObj
 
 
 class FabricClient:
@@ -24,6 +27,7 @@ class FabricClient:
 class Poller:
 
     CLIENT_TYPE = 'tg'
+    POLL_TIMEOUT = 60
 
     def __init__(self, token: str, queue: asyncio.Queue):
         # обязательный параметр, в _task нужно положить запущенную корутину поллера
@@ -36,25 +40,57 @@ class Poller:
     async def _worker(self):
         """
         нужно получать данные из tg, стоит использовать метод get_updates_in_objects
+        (здесь он разбит на get_updates и decode_updates)
         полученные сообщения нужно положить в очередь queue
         в очередь queue нужно класть UpdateObj
+
+        Следующий запрос getUpdates уходит сразу, как только из сырого ответа известен offset,
+        а полученная пачка разбирается в UpdateObj и кладется в очередь, пока этот запрос ждет ответа.
+        Если очередь ограничена и заполнена, поллер ждет место и не запрашивает новые пачки.
         """
-        update_data = None
+        update_data: Deque[UpdateObj] = deque()
+        request: Optional[asyncio.Task] = None
+        # пачка, offset которой уже подтвержден следующим запросом, но еще не разобранная
+        confirmed: Optional[dict] = None
+        client = None
         try:
             async with self.client(self.token) as client:
                 offset = 0
+                request = asyncio.create_task(client.get_updates(timeout=self.POLL_TIMEOUT, offset=offset))
                 while self.is_running:
-                    update_data = await client.get_updates_in_objects(timeout=60, offset=offset)
-                    if update_data:
-                        offset = update_data[-1].update_id + 1
-                        for item in update_data:
-                            await self.queue.put(item)
-                        update_data = None
+                    response = await request
+                    result = response.get('result') or []
+                    if result:
+                        offset = result[-1]['update_id'] + 1
+                        confirmed = response
+                    request = asyncio.create_task(client.get_updates(timeout=self.POLL_TIMEOUT, offset=offset))
+                    # отдаем управление, чтобы запрос ушел в сеть до разбора пачки
+                    await asyncio.sleep(0)
+                    if confirmed is not None:
+                        update_data.extend(client.decode_updates(confirmed))
+                        confirmed = None
+                    await self._enqueue(update_data)
         except asyncio.CancelledError:
-            if update_data:
-                for item in update_data:
-                    await self.queue.put(item)
+            if confirmed is not None:
+                # повторно эта пачка уже не придет, поэтому разбираем ее и при отмене
+                try:
+                    update_data.extend(client.decode_updates(confirmed))
+                except TgClientError as error:
+                    logging.exception(error)
+            await self._enqueue(update_data)
             raise
+        finally:
+            if request and not request.done():
+                request.cancel()
+
+    async def _enqueue(self, update_data: Deque[UpdateObj]):
+        """Кладет в очередь сразу все, на что есть место, и ждет место только для остатка"""
+        while update_data:
+            while update_data and not self.queue.full():
+                self.queue.put_nowait(update_data.popleft())
+            if update_data:
+                await self.queue.put(update_data[0])
+                update_data.popleft()
 
     def start(self):
         """
@@ -0,0 +1,139 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Deque, Dict, Optional
+
+import aiohttp
+
+from clients.fapi.tg import TgClientWithFile
+from clients.tg.api import TgClientError, TgRetryAfterError
+
+
+@dataclass
+class SenderConfig:
+    # лимиты Telegram: порядка 30 сообщений в секунду на бота и 1 в секунду в один чат
+    global_rate: float = 30
+    chat_rate: float = 1
+    chat_burst: int = 3
+    max_retries: int = 5
+    retry_delay: float = 1
+    # склеивать несколько сообщений одному чату, накопившихся в очереди, в одно
+    coalesce: bool = False
+    coalesce_limit: int = 4096
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: Optional[float] = None, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.tokens = self.capacity
+        self._clock = clock
+        self._updated = clock()
+
+    def _refill(self):
+        now = self._clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    @property
+    def is_full(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity
+
+    async def acquire(self):
+        while True:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class Sender:
+    """
+    Отправка сообщений в Telegram в фоне.
+    send кладет сообщение в очередь чата и сразу возвращается. Для каждого чата с сообщениями в очереди
+    работает своя задача: сообщения одного чата уходят по порядку, с общим и поканальным token bucket,
+    на 429 задача ждет retry_after и повторяет отправку.
+    """
+
+    def __init__(self, token: str, config: Optional[SenderConfig] = None, client_cls=TgClientWithFile):
+        self.token = token
+        self.config = config or SenderConfig()
+        self.client_cls = client_cls
+        self.client: Optional[TgClientWithFile] = None
+        self._global_bucket = TokenBucket(self.config.global_rate)
+        self._chat_buckets: Dict[int, TokenBucket] = {}
+        self._queues: Dict[int, Deque[str]] = {}
+        self._tasks: Dict[int, asyncio.Task] = {}
+
+    def start(self):
+        if self.client is None:
+            self.client = self.client_cls(self.token)
+
+    def send(self, chat_id: int, text: str):
+        self._queues.setdefault(chat_id, deque()).append(text)
+        if chat_id not in self._tasks:
+            self._tasks[chat_id] = asyncio.create_task(self._chat_worker(chat_id))
+
+    async def join(self):
+        """Ждет, пока будут отправлены все сообщения из очереди"""
+        while self._tasks:
+            await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+    async def stop(self):
+        await self.join()
+        if self.client is not None:
+            await self.client.__aexit__(None, None, None)
+            self.client = None
+
+    def _next_text(self, queue: Deque[str]) -> str:
+        text = queue.popleft()
+        if self.config.coalesce:
+            while queue and len(text) + len(queue[0]) + 1 <= self.config.coalesce_limit:
+                text = f'{text}\n{queue.popleft()}'
+        return text
+
+    async def _chat_worker(self, chat_id: int):
+        queue = self._queues[chat_id]
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.config.chat_rate, self.config.chat_burst)
+        try:
+            while queue:
+                text = self._next_text(queue)
+                await bucket.acquire()
+                await self._global_bucket.acquire()
+                await self._send(chat_id, text)
+        finally:
+            del self._tasks[chat_id]
+            del self._queues[chat_id]
+            self._prune_buckets()
+
+    def _prune_buckets(self):
+        # полный bucket ничем не отличается от нового, его можно не хранить
+        for chat_id in [chat_id for chat_id, bucket in self._chat_buckets.items()
+                        if chat_id not in self._tasks and bucket.is_full]:
+            del self._chat_buckets[chat_id]
+
+    async def _send(self, chat_id: int, text: str):
+        self.start()
+        attempt = 0
+        while True:
+            try:
+                await self.client.send_message(chat_id, text)
+                return
+            except TgRetryAfterError as error:
+                delay = error.retry_after
+            except TgClientError as error:
+                logging.error('message to chat %s was not sent: %s', chat_id, error.content)
+                return
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                delay = self.config.retry_delay * (attempt + 1)
+            attempt += 1
+            if attempt > self.config.max_retries:
+                logging.error('message to chat %s was not sent after %s retries', chat_id, self.config.max_retries)
+                return
+            await asyncio.sleep(delay)
@@ -1,7 +1,13 @@
 import asyncio
-from dataclasses import dataclass
-from typing import List
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List, Optional
 
+from botocore.exceptions import ClientError
+
+from bot.sender import Sender, SenderConfig
+from bot.utils import log_exceptions
+from clients.fapi.dedup import UploadIndex
 from clients.fapi.s3 import S3Client
 from clients.fapi.tg import TgClientWithFile
 from clients.tg.dcs import UpdateObj
@@ -14,24 +20,53 @@ class WorkerConfig:
     aws_access_key_id: str
     bucket: str
     concurrent_workers: int = 1
+    max_pool_connections: int = S3Client.MAX_POOL_CONNECTIONS
+    # сколько апдейтов может ждать обработки у всех чатов вместе, дальше диспетчер перестает брать новые
+    max_pending_updates: int = 1000
+    sender: SenderConfig = field(default_factory=SenderConfig)
+    # путь к локальному индексу загруженных файлов, без него индекс хранится только в памяти
+    uploads_index_path: Optional[str] = None
+    uploads_cache_size: int = 1024
+    # журнал multipart-загрузок, с ним прерванные загрузки продолжаются после перезапуска
+    uploads_journal_path: Optional[str] = None
 
 
 class Worker:
+    # в метаданных объекта хранится file_unique_id документа: имя файла выбирает пользователь,
+    # и объект под ним может перезаписать другой документ, поэтому запись индекса сверяется с метаданными
+    UNIQUE_ID_METADATA = 'file-unique-id'
+
     def __init__(self, token: str, queue: asyncio.Queue, config: WorkerConfig):
         # обязательный параметр, в него нужно сохранить запущенные корутины воркера
         self.token = token
         self.queue = queue
         self._tasks: List[asyncio.Task] = []
+        # апдейты одного чата обрабатываются по порядку, разные чаты - параллельно:
+        # у каждого чата своя очередь апдейтов, свободные воркеры забирают готовые чаты из _ready
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._backlogs: Dict[int, Deque[UpdateObj]] = {}
+        self._ready: Optional[asyncio.Queue] = None
+        self._pending: Optional[asyncio.Semaphore] = None
+        # сборка брошенных multipart-загрузок при старте
+        self._gc: Optional[asyncio.Task] = None
         # обязательный параметр, выполнять работу с s3 нужно через объект класса self.s3
         # для загрузки файла нужно использовать функцию fetch_and_upload или stream_upload
         self.s3 = S3Client(
             endpoint_url=config.endpoint_url,
             aws_secret_access_key=config.aws_secret_access_key,
-            aws_access_key_id=config.aws_access_key_id
+            aws_access_key_id=config.aws_access_key_id,
+            max_pool_connections=config.max_pool_connections,
+            journal_path=config.uploads_journal_path
         )
+        # повторно присланные файлы не скачиваются, а копируются внутри s3 по file_unique_id
+        self.uploads = UploadIndex(config.uploads_index_path, config.uploads_cache_size)
+        # загрузки, которые идут сейчас, по file_unique_id: повторы ждут их и затем копируют объект
+        self._uploading: Dict[str, asyncio.Task] = {}
         self.is_running = False
         self.config = config
         self.client = TgClientWithFile
+        # ответы отправляются в фоне через очередь с ограничением частоты
+        self.sender = Sender(token, config.sender, self.client)
         self.first_message = False
 
     async def handle_update(self, upd: UpdateObj):
@@ -51,25 +86,91 @@ class Worker:
             await self._send_message(chat_id, '[document is required]')
 
     async def _send_message(self, chat_id: int, message: str):
-        async with TgClientWithFile(self.token) as client:
-            await client.send_message(chat_id, message)
+        self.sender.send(chat_id, message)
 
     async def _upload_file(self, upd: UpdateObj):
-        file_id = upd.message.document.file_id
-        file_name = upd.message.document.file_name
-        url = f'{self.client.BASE_PATH}/file/bot{self.token}/{file_id}'
-        async with self.s3:
-            await self.s3.fetch_and_upload(self.config.bucket, file_name, url)
+        document = upd.message.document
+        unique_id = document.file_unique_id
+        file_name = document.file_name or unique_id
+        while unique_id in self._uploading:
+            # тот же документ уже загружается, ждем и копируем результат
+            await asyncio.wait({self._uploading[unique_id]})
+        if await self._copy_uploaded(unique_id, file_name):
+            return
+        task = asyncio.ensure_future(self._store_document(document, file_name))
+        self._uploading[unique_id] = task
+        task.add_done_callback(lambda done: self._uploading.pop(unique_id, None))
+        # shield: отмена этого обработчика не отменяет загрузку для тех, кто ее ждет
+        await asyncio.shield(task)
+
+    async def _store_document(self, document, file_name: str):
+        async with self.client(self.token) as client:
+            file = await client.get_file(document.file_id)
+            url = client.get_file_url(file.file_path)
+        await self.s3.upload_from_url(self.config.bucket, file_name, url, file.file_size or document.file_size,
+                                      source=document.file_unique_id,
+                                      metadata={self.UNIQUE_ID_METADATA: document.file_unique_id})
+        self.uploads.put(document.file_unique_id, self.config.bucket, file_name)
+
+    async def _copy_uploaded(self, unique_id: str, file_name: str) -> bool:
+        """
+        Если документ уже загружен, при необходимости копирует его под имя file_name на стороне s3 и возвращает True.
+        Запись индекса проверяется по метаданным объекта: если объекта нет или его перезаписал другой документ,
+        запись удаляется и документ нужно загрузить заново.
+        """
+        location = self.uploads.get(unique_id)
+        if location is None:
+            return False
+        try:
+            metadata = await self.s3.get_metadata(*location)
+            if metadata.get(self.UNIQUE_ID_METADATA) != unique_id:
+                self.uploads.discard(unique_id)
+                return False
+            if location != (self.config.bucket, file_name):
+                await self.s3.copy_file(*location, self.config.bucket, file_name)
+        except ClientError:
+            self.uploads.discard(unique_id)
+            return False
+        return True
+
+    async def _dispatch(self):
+        """
+        раскладывает апдейты из общей очереди по очередям чатов, чат без очереди становится готовым.
+        Ждет только общий лимит max_pending_updates, поэтому горячий чат не задерживает остальные
+        """
+        while self.is_running:
+            item = await self.queue.get()
+            await self._pending.acquire()
+            chat_id = item.message.chat.id
+            backlog = self._backlogs.get(chat_id)
+            if backlog is None:
+                # чат не в обработке и не в _ready, его может взять любой свободный воркер
+                self._backlogs[chat_id] = deque([item])
+                self._ready.put_nowait(chat_id)
+            else:
+                backlog.append(item)
 
     async def _worker(self):
         """
         должен получать сообщения из очереди и вызывать handle_update
+        Воркер берет готовый чат, обрабатывает один его апдейт и возвращает чат в конец _ready,
+        если у него остались апдейты. Чат одновременно у одного воркера, поэтому порядок сохраняется.
         """
         try:
             while self.is_running:
-                item = await self.queue.get()
-                await self.handle_update(item)
-                self.queue.task_done()
+                chat_id = await self._ready.get()
+                backlog = self._backlogs[chat_id]
+                item = backlog[0]
+                try:
+                    await log_exceptions(self.handle_update(item))
+                finally:
+                    backlog.popleft()
+                    if backlog:
+                        self._ready.put_nowait(chat_id)
+                    else:
+                        del self._backlogs[chat_id]
+                    self._pending.release()
+                    self.queue.task_done()
         except asyncio.CancelledError:
             raise
 
@@ -79,6 +180,12 @@ class Worker:
         запущенные задачи нужно положить в _tasks
         """
         self.is_running = True
+        self.sender.start()
+        self._ready = asyncio.Queue()
+        self._pending = asyncio.Semaphore(self.config.max_pending_updates)
+        self._dispatcher = asyncio.create_task(self._dispatch())
+        if self.s3.journal is not None:
+            self._gc = asyncio.create_task(log_exceptions(self.s3.collect_stale_uploads(self.config.bucket)))
         self._tasks.extend([asyncio.create_task(self._worker()) for _ in range(self.config.concurrent_workers)])
 
     async def stop(self):
@@ -87,9 +194,16 @@ class Worker:
         """
         await self.queue.join()
         self.is_running = False
+        if self._dispatcher:
+            self._dispatcher.cancel()
+        if self._gc:
+            self._gc.cancel()
         for task in self._tasks:
             task.cancel()
         try:
-            await asyncio.gather(*self._tasks)
+            await asyncio.gather(self._dispatcher, *self._tasks)
         except asyncio.CancelledError:
             print('CANCELLED')
+        await self.sender.stop()
+        await self.s3.close()
+        self.uploads.close()
@@ -3,6 +3,9 @@ from typing import Any
 import aiohttp
 from aiohttp import ClientResponse
 
+from clients.codec import JsonCodec, get_default_codec
+from clients.session import SessionPool
+
 
 class ClientError(Exception):
     def __init__(self, response: ClientResponse, content: Any = None):
@@ -12,15 +15,21 @@ class ClientError(Exception):
 
 class Client:
     BASE_PATH = ''
+    # кодек для тел запросов и ответов, по умолчанию orjson, если он установлен
+    codec: JsonCodec = get_default_codec()
 
     def __init__(self):
-        self.session = aiohttp.ClientSession()
+        shared = SessionPool.get()
+        # собственную сессию закрываем на выходе, общую - нет, ее жизненным циклом управляет SessionPool
+        self._owns_session = shared is None
+        self.session = shared if shared is not None else aiohttp.ClientSession()
 
     async def __aenter__(self):
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        await self.session.close()
+        if self._owns_session:
+            await self.session.close()
 
     def get_base_path(self) -> str:
         return self.BASE_PATH.strip('/')
@@ -33,6 +42,17 @@ class Client:
     async def _handle_response(self, resp: ClientResponse) -> Any:
         return resp
 
+    async def _read_json(self, resp: ClientResponse) -> Any:
+        body = await resp.read()
+        if not body.strip():
+            return None
+        return self.codec.loads(body)
+
     async def _perform_request(self, method: str, url: str, **kwargs) -> Any:
+        if kwargs.get('json') is not None:
+            headers = dict(kwargs.pop('headers', None) or {})
+            headers.setdefault('Content-Type', 'application/json')
+            kwargs['data'] = self.codec.dumps(kwargs.pop('json'))
+            kwargs['headers'] = headers
         async with self.session.request(method, url, **kwargs) as resp:
             return await self._handle_response(resp)
@@ -0,0 +1,38 @@
+import json
+from typing import Any
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class JsonCodec:
+    """Кодек на стандартном модуле json"""
+    name = 'json'
+
+    def loads(self, data: bytes) -> Any:
+        return json.loads(data)
+
+    def dumps(self, obj: Any) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+class OrjsonCodec(JsonCodec):
+    """
+    Кодек на orjson, разбирает тело ответа прямо из bytes.
+    orjson.JSONDecodeError наследуется от json.JSONDecodeError, поэтому обработка ошибок не меняется.
+    """
+    name = 'orjson'
+
+    def loads(self, data: bytes) -> Any:
+        return orjson.loads(data)
+
+    def dumps(self, obj: Any) -> bytes:
+        return orjson.dumps(obj)
+
+
+def get_default_codec() -> JsonCodec:
+    if orjson is not None:
+        return OrjsonCodec()
+    return JsonCodec()
@@ -0,0 +1,60 @@
+import asyncio
+from typing import AsyncIterator, Optional
+
+
+class BufferPool:
+    """Небольшой пул переиспользуемых bytearray фиксированного размера"""
+
+    def __init__(self, size: int, count: int):
+        self.size = size
+        self.count = count
+        self._created = 0
+        self._free: Optional[asyncio.Queue] = None
+
+    async def acquire(self) -> bytearray:
+        if self._free is None:
+            self._free = asyncio.Queue()
+        if self._free.empty() and self._created < self.count:
+            self._created += 1
+            return bytearray(self.size)
+        return await self._free.get()
+
+    def release(self, buffer: bytearray) -> None:
+        # укороченный буфер последней части в пул не возвращаем, вместо него позже будет создан новый
+        if len(buffer) != self.size:
+            self._created -= 1
+            return
+        if self._free is None:
+            self._free = asyncio.Queue()
+        self._free.put_nowait(buffer)
+
+
+async def assemble_parts(chunks: AsyncIterator[bytes], pool: BufferPool) -> AsyncIterator[bytearray]:
+    """
+    Собирает поток чанков произвольного размера в части ровно по pool.size байт.
+    Чанки копируются сразу в буферы из пула, последняя часть укорачивается на месте.
+    Отданный буфер нужно вернуть в пул через pool.release, когда он больше не нужен.
+    """
+    size = pool.size
+    buffer = await pool.acquire()
+    view = memoryview(buffer)
+    filled = 0
+    async for data in chunks:
+        data = memoryview(data)
+        while data:
+            count = min(len(data), size - filled)
+            view[filled:filled + count] = data[:count]
+            filled += count
+            data = data[count:]
+            if filled == size:
+                view.release()
+                yield buffer
+                buffer = await pool.acquire()
+                view = memoryview(buffer)
+                filled = 0
+    view.release()
+    if filled:
+        del buffer[filled:]
+        yield buffer
+    else:
+        pool.release(buffer)
@@ -0,0 +1,52 @@
+import dbm
+import json
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+
+class UploadIndex:
+    """
+    Индекс загруженных файлов: file_unique_id -> (bucket, key) объекта в s3.
+    Недавние записи хранятся в LRU в памяти, все записи - в локальной базе dbm по пути path,
+    поэтому индекс переживает перезапуск бота. Без path индекс живет только в памяти.
+    """
+
+    def __init__(self, path: Optional[str] = None, capacity: int = 1024):
+        self.capacity = capacity
+        self._cache: OrderedDict[str, Tuple[str, str]] = OrderedDict()
+        self._db = dbm.open(path, 'c') if path else None
+
+    def get(self, unique_id: str) -> Optional[Tuple[str, str]]:
+        location = self._cache.get(unique_id)
+        if location is not None:
+            self._cache.move_to_end(unique_id)
+            return location
+        if self._db is None:
+            return None
+        raw = self._db.get(unique_id)
+        if raw is None:
+            return None
+        bucket, key = json.loads(raw)
+        self._remember(unique_id, (bucket, key))
+        return bucket, key
+
+    def put(self, unique_id: str, bucket: str, key: str):
+        self._remember(unique_id, (bucket, key))
+        if self._db is not None:
+            self._db[unique_id] = json.dumps([bucket, key])
+
+    def discard(self, unique_id: str):
+        self._cache.pop(unique_id, None)
+        if self._db is not None and unique_id in self._db:
+            del self._db[unique_id]
+
+    def _remember(self, unique_id: str, location: Tuple[str, str]):
+        self._cache[unique_id] = location
+        self._cache.move_to_end(unique_id)
+        while len(self._cache) > self.capacity:
+            self._cache.popitem(last=False)
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
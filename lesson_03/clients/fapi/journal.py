@@ -0,0 +1,158 @@
+import asyncio
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+
+
+@dataclass
+class JournalUpload:
+    upload_id: str
+    bucket: str
+    key: str
+    source: str
+    created_at: float
+    # номер части -> (размер, ETag)
+    parts: Dict[int, Tuple[int, str]] = field(default_factory=dict)
+
+
+class UploadJournal:
+    """
+    Локальный журнал multipart-загрузок в формате JSON Lines, в файл только дописываются записи:
+    create (UploadId, bucket, key, источник), part (номер, размер, ETag), complete/abort.
+    По журналу незавершенную загрузку того же источника можно продолжить после перезапуска.
+    Журнал читается с диска один раз, дальше состояние хранится в памяти. Запись и fsync идут в пуле потоков,
+    после каждой завершенной или отмененной загрузки файл переписывается только с незавершенными.
+    Загрузки, которые сейчас ведет MultipartUploader в этом процессе, помечены живыми и не отдаются для продолжения.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._uploads: Optional[Dict[str, JournalUpload]] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._live: Set[str] = set()
+
+    def _file_lock(self) -> asyncio.Lock:
+        # lock сохраняет порядок записей и не дает дописывать в файл, пока он переписывается
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    async def _run(self, func, *args):
+        async with self._file_lock():
+            return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    async def _state(self) -> Dict[str, JournalUpload]:
+        if self._uploads is None:
+            uploads = await self._run(self._replay)
+            if self._uploads is None:
+                self._uploads = uploads
+        return self._uploads
+
+    def _replay(self) -> Dict[str, JournalUpload]:
+        uploads: Dict[str, JournalUpload] = {}
+        if not os.path.exists(self.path):
+            return uploads
+        with open(self.path) as fd:
+            for line in fd:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # строка, недописанная при падении
+                    continue
+                self._apply(uploads, record)
+        return uploads
+
+    @staticmethod
+    def _apply(uploads: Dict[str, JournalUpload], record: dict):
+        op = record['op']
+        if op == 'create':
+            uploads[record['upload_id']] = JournalUpload(
+                record['upload_id'], record['bucket'], record['key'], record['source'], record['created_at']
+            )
+        elif op == 'part':
+            if record['upload_id'] in uploads:
+                uploads[record['upload_id']].parts[record['number']] = (record['size'], record['etag'])
+        else:
+            uploads.pop(record['upload_id'], None)
+
+    async def _append(self, record: dict):
+        self._apply(await self._state(), record)
+        await self._run(self._write, record)
+
+    def _write(self, record: dict):
+        with open(self.path, 'a') as fd:
+            fd.write(json.dumps(record) + '\n')
+            fd.flush()
+            os.fsync(fd.fileno())
+
+    async def pending(self) -> List[JournalUpload]:
+        """Незавершенные загрузки, от старых к новым"""
+        return sorted((await self._state()).values(), key=lambda upload: upload.created_at)
+
+    async def acquire(self, bucket: str, key: str, source: str) -> Optional[JournalUpload]:
+        """
+        Последняя незавершенная и никем не занятая загрузка source в bucket/key.
+        Найденная загрузка помечается живой, пока ее не завершат, не отменят или не вернут через release.
+        """
+        found = None
+        for upload in await self.pending():
+            if upload.upload_id in self._live:
+                continue
+            if (upload.bucket, upload.key, upload.source) == (bucket, key, source):
+                found = upload
+        if found is not None:
+            self._live.add(found.upload_id)
+        return found
+
+    def release(self, upload_id: str):
+        """Загрузка остается в журнале, но ее снова можно продолжить"""
+        self._live.discard(upload_id)
+
+    def is_live(self, upload_id: str) -> bool:
+        return upload_id in self._live
+
+    async def created(self, upload_id: str, bucket: str, key: str, source: str):
+        self._live.add(upload_id)
+        await self._append({'op': 'create', 'upload_id': upload_id, 'bucket': bucket, 'key': key,
+                            'source': source, 'created_at': time.time()})
+
+    async def part(self, upload_id: str, number: int, size: int, etag: str):
+        await self._append({'op': 'part', 'upload_id': upload_id, 'number': number, 'size': size, 'etag': etag})
+
+    async def completed(self, upload_id: str):
+        self._live.discard(upload_id)
+        (await self._state()).pop(upload_id, None)
+        await self.compact()
+
+    async def aborted(self, upload_id: str):
+        self._live.discard(upload_id)
+        (await self._state()).pop(upload_id, None)
+        await self.compact()
+
+    async def discard(self, upload_id: str):
+        """Забывает загрузку без записи на диск, файл обновится при следующем compact"""
+        (await self._state()).pop(upload_id, None)
+
+    async def compact(self):
+        """Переписывает журнал, оставляя только незавершенные загрузки"""
+        await self._state()
+        # снимок берется под lock, чтобы в него попали все записи, уже дописанные в файл
+        async with self._file_lock():
+            records = []
+            for upload in sorted(self._uploads.values(), key=lambda item: item.created_at):
+                records.append({'op': 'create', 'upload_id': upload.upload_id, 'bucket': upload.bucket,
+                                'key': upload.key, 'source': upload.source, 'created_at': upload.created_at})
+                records.extend({'op': 'part', 'upload_id': upload.upload_id, 'number': number, 'size': size,
+                                'etag': etag} for number, (size, etag) in sorted(upload.parts.items()))
+            await asyncio.get_running_loop().run_in_executor(None, self._rewrite, records)
+
+    def _rewrite(self, records: List[dict]):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as fd:
+            for record in records:
+                fd.write(json.dumps(record) + '\n')
+            fd.flush()
+            os.fsync(fd.fileno())
+        os.replace(tmp_path, self.path)
@@ -1,64 +1,317 @@
+import asyncio
+import os
+import time
+from collections import deque
+from contextlib import AsyncExitStack
+from typing import AsyncIterator, Dict, Iterator, Optional, Tuple
+
+from aiobotocore.config import AioConfig
 from aiobotocore.session import get_session
-import aiohttp
-from sys import getsizeof
+from botocore.exceptions import ClientError
 
+from clients.fapi.buffers import BufferPool, assemble_parts
+from clients.fapi.journal import UploadJournal
 from clients.fapi.uploader import MultipartUploader
+from clients.session import shared_session
 
 
 class S3Client:
     UPLOAD_READ_SIZE = 10 * 1024 * 1024
     DOWNLOAD_READ_SIZE = 5 * 1024 * 1024
+    UPLOAD_CONCURRENCY = 4
+    # файлы не больше этого размера загружаются одним put_object, остальные - потоком через multipart
+    SINGLE_UPLOAD_MAX_SIZE = DOWNLOAD_READ_SIZE
+    MAX_POOL_CONNECTIONS = 10
+    # чтение объектов: размер диапазона одного get_object и сколько диапазонов качается одновременно
+    DOWNLOAD_RANGE_SIZE = 8 * 1024 * 1024
+    DOWNLOAD_CONCURRENCY = 4
+    # незавершенные multipart-загрузки старше этого срока удаляются в collect_stale_uploads, секунды
+    STALE_UPLOAD_AGE = 24 * 60 * 60
 
-    def __init__(self, endpoint_url: str, aws_access_key_id: str, aws_secret_access_key: str):
+    def __init__(self, endpoint_url: str, aws_access_key_id: str, aws_secret_access_key: str,
+                 region_name: str = 'us-west-2', max_pool_connections: int = MAX_POOL_CONNECTIONS,
+                 journal_path: Optional[str] = None):
         self.session = get_session()
         self.endpoint_url = endpoint_url
         self.key_id = aws_access_key_id
         self.access_key = aws_secret_access_key
+        self.region_name = region_name
+        self.max_pool_connections = max_pool_connections
+        # с журналом потоковые загрузки продолжаются после перезапуска с последней подтвержденной части
+        self.journal = UploadJournal(journal_path) if journal_path else None
+
+        self._client = None
+        self._exit_stack: Optional[AsyncExitStack] = None
+        self._client_lock: Optional[asyncio.Lock] = None
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def connect(self):
+        """
+        Создает s3-клиент с пулом соединений один раз на все время жизни S3Client.
+        Вызывается лениво из методов загрузки, закрывается через close или выход из async with.
+        """
+        if self._client is not None:
+            return self._client
+        if self._client_lock is None:
+            self._client_lock = asyncio.Lock()
+        async with self._client_lock:
+            if self._client is None:
+                exit_stack = AsyncExitStack()
+                self._client = await exit_stack.enter_async_context(
+                    self.session.create_client('s3', region_name=self.region_name,
+                                               endpoint_url=self.endpoint_url,
+                                               aws_secret_access_key=self.access_key,
+                                               aws_access_key_id=self.key_id,
+                                               config=AioConfig(max_pool_connections=self.max_pool_connections))
+                )
+                self._exit_stack = exit_stack
+        return self._client
+
+    async def close(self):
+        if self._exit_stack is not None:
+            await self._exit_stack.aclose()
+        self._exit_stack = None
+        self._client = None
+
+    async def upload_file(self, bucket: str, path: str, buffer, metadata: Optional[Dict[str, str]] = None):
+        client = await self.connect()
+        await client.put_object(Bucket=bucket, Key=path, Body=buffer, **({'Metadata': metadata} if metadata else {}))
+
+    async def get_metadata(self, bucket: str, path: str) -> Dict[str, str]:
+        """Пользовательские метаданные объекта (x-amz-meta-*)"""
+        client = await self.connect()
+        head = await client.head_object(Bucket=bucket, Key=path)
+        return head.get('Metadata', {})
 
-    async def upload_file(self, bucket: str, path: str, buffer):
-        async with self.session.create_client('s3', region_name='', endpoint_url=self.endpoint_url,
-                                              aws_secret_access_key=self.access_key,
-                                              aws_access_key_id=self.key_id) as client:
-            await client.put_object(Bucket=bucket, Key=path, Body=buffer)
+    async def copy_file(self, source_bucket: str, source_path: str, bucket: str, path: str):
+        """Копирует объект вместе с метаданными внутри s3 без скачивания и повторной загрузки"""
+        client = await self.connect()
+        await client.copy_object(Bucket=bucket, Key=path, CopySource={'Bucket': source_bucket, 'Key': source_path})
 
-    async def fetch_and_upload(self, bucket: str, path: str, url: str):
-        async with aiohttp.ClientSession() as session:
+    async def fetch_and_upload(self, bucket: str, path: str, url: str, metadata: Optional[Dict[str, str]] = None):
+        async with shared_session() as session:
             async with session.get(url) as resp:
+                resp.raise_for_status()
                 buffer = await resp.read()
-        await self.upload_file(bucket, path, buffer)
-
-    async def stream_upload(self, bucket: str, path: str, url: str):
-        async with self.session.create_client('s3', region_name='us-west-2',
-                                              endpoint_url=self.endpoint_url,
-                                              aws_secret_access_key=self.access_key,
-                                              aws_access_key_id=self.key_id) as client:
-            async with MultipartUploader(client=client, bucket=bucket, key=path) as uploader:
-                async for data in self._download_stream_file(url):
-                    await uploader.upload_part(data)
-
-    async def _download_stream_file(self, url):
-        buffer = b''
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as resp:
-                async for data in resp.content.iter_chunked(self.DOWNLOAD_READ_SIZE):
-                    if getsizeof(buffer) < self.DOWNLOAD_READ_SIZE:
-                        buffer += data
-                    else:
-                        yield buffer
-                        buffer = b''
-                if buffer:
-                    yield buffer
+        await self.upload_file(bucket, path, buffer, metadata)
+
+    async def upload_from_url(self, bucket: str, path: str, url: str, size: Optional[int] = None,
+                              source: Optional[str] = None, metadata: Optional[Dict[str, str]] = None):
+        """
+        Загружает файл по url в s3 с постоянным расходом памяти.
+        Маленькие файлы (size известен и не больше SINGLE_UPLOAD_MAX_SIZE) загружаются одним запросом.
+        source - постоянный идентификатор содержимого, по нему прерванная загрузка продолжается из журнала.
+        metadata - пользовательские метаданные объекта.
+        """
+        if size is not None and size <= self.SINGLE_UPLOAD_MAX_SIZE:
+            await self.fetch_and_upload(bucket, path, url, metadata)
+        else:
+            await self.stream_upload(bucket, path, url, source, size, metadata)
+
+    async def stream_upload(self, bucket: str, path: str, url: str, source: Optional[str] = None,
+                            size: Optional[int] = None, metadata: Optional[Dict[str, str]] = None):
+        pool = BufferPool(self.DOWNLOAD_READ_SIZE, self.UPLOAD_CONCURRENCY + 1)
+        client = await self.connect()
+        async with MultipartUploader(
+                client=client, bucket=bucket, key=path, concurrency=self.UPLOAD_CONCURRENCY,
+                journal=self.journal, source=source, metadata=metadata
+        ) as uploader:
+            # после падения между последней частью и complete скачивать уже нечего, остается завершить загрузку
+            if size is not None and uploader.resume_offset >= size:
+                return
+            async for data in self._download_stream_file(url, pool, uploader.resume_offset):
+                await uploader.upload_part(data, release=pool.release)
+
+    async def _download_stream_file(self, url: str, pool: BufferPool, offset: int = 0):
+        headers = {'Range': f'bytes={offset}-'} if offset else None
+        async with shared_session() as session:
+            async with session.get(url, headers=headers) as resp:
+                if offset and resp.status == 416 and _range_total(resp) == offset:
+                    # все байты источника уже загружены
+                    return
+                resp.raise_for_status()
+                chunks = resp.content.iter_any()
+                if offset and resp.status != 206:
+                    # сервер не поддерживает Range, уже загруженное начало пропускаем
+                    chunks = _skip_bytes(chunks, offset)
+                async for data in assemble_parts(chunks, pool):
+                    yield data
 
     async def stream_file(self, bucket: str, path: str, file: str):
-        async with self.session.create_client('s3', region_name='us-west-2',
-                                              endpoint_url=self.endpoint_url,
-                                              aws_secret_access_key=self.access_key,
-                                              aws_access_key_id=self.key_id) as client:
-            async with MultipartUploader(
-                    client=client, bucket=bucket, key=path
-            ) as uploader:
-                with open(file, 'rb') as fd:
-                    buf = fd.read(self.UPLOAD_READ_SIZE)
-                    while buf:
-                        await uploader.upload_part(buf)
-                        buf = fd.read(self.UPLOAD_READ_SIZE)
+        client = await self.connect()
+        stat = os.stat(file)
+        source = f'{os.path.abspath(file)}:{stat.st_size}:{stat.st_mtime_ns}'
+        pool = BufferPool(self.UPLOAD_READ_SIZE, self.UPLOAD_CONCURRENCY + 1)
+        async with MultipartUploader(
+                client=client, bucket=bucket, key=path, concurrency=self.UPLOAD_CONCURRENCY,
+                journal=self.journal, source=source
+        ) as uploader:
+            async for data in self._read_stream_file(file, pool, uploader.resume_offset):
+                await uploader.upload_part(data, release=pool.release)
+
+    @staticmethod
+    async def _read_stream_file(file: str, pool: BufferPool, offset: int = 0):
+        """
+        Читает файл частями по pool.size байт прямо в буферы из пула.
+        Чтение с диска выполняется в пуле потоков и не блокирует event loop.
+        """
+        loop = asyncio.get_running_loop()
+        with open(file, 'rb', buffering=0) as fd:
+            fd.seek(offset)
+            while True:
+                buffer = await pool.acquire()
+                count = await loop.run_in_executor(None, _read_into, fd, buffer)
+                if not count:
+                    pool.release(buffer)
+                    return
+                if count < len(buffer):
+                    del buffer[count:]
+                yield buffer
+
+    async def download_file(self, bucket: str, path: str, destination: str,
+                            range_size: int = DOWNLOAD_RANGE_SIZE, concurrency: int = DOWNLOAD_CONCURRENCY) -> int:
+        """
+        Скачивает объект в файл destination диапазонами по range_size байт, concurrency диапазонов одновременно.
+        Файл сразу создается нужного размера, диапазоны пишутся по своим смещениям в пуле потоков.
+        Возвращает размер объекта.
+        """
+        client = await self.connect()
+        size, etag = await self._head_object(client, bucket, path)
+        ranges = self._ranges(size, range_size)
+        loop = asyncio.get_running_loop()
+
+        async def worker():
+            for start, end in ranges:
+                data = await self._get_range(client, bucket, path, start, end, etag)
+                await loop.run_in_executor(None, os.pwrite, fd, data, start)
+
+        fd = os.open(destination, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.ftruncate(fd, size)
+            workers = [asyncio.create_task(worker()) for _ in range(max(concurrency, 1))]
+            try:
+                await asyncio.gather(*workers)
+            finally:
+                for task in workers:
+                    task.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+        finally:
+            os.close(fd)
+        return size
+
+    async def iter_object(self, bucket: str, path: str, range_size: int = DOWNLOAD_RANGE_SIZE,
+                          concurrency: int = DOWNLOAD_CONCURRENCY) -> AsyncIterator[bytes]:
+        """
+        Отдает объект по порядку кусками по range_size байт.
+        Следующие concurrency диапазонов качаются заранее, память ограничена concurrency * range_size.
+        """
+        client = await self.connect()
+        size, etag = await self._head_object(client, bucket, path)
+        ranges = self._ranges(size, range_size)
+        pending = deque()
+
+        def schedule():
+            for start, end in ranges:
+                pending.append(asyncio.create_task(self._get_range(client, bucket, path, start, end, etag)))
+                return
+
+        try:
+            for _ in range(max(concurrency, 1)):
+                schedule()
+            while pending:
+                data = await pending.popleft()
+                schedule()
+                yield data
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    @staticmethod
+    async def _head_object(client, bucket: str, path: str) -> Tuple[int, str]:
+        head = await client.head_object(Bucket=bucket, Key=path)
+        return head['ContentLength'], head['ETag']
+
+    @staticmethod
+    def _ranges(size: int, range_size: int) -> Iterator[Tuple[int, int]]:
+        # один итератор на всех воркеров, каждый диапазон достается ровно одному
+        return ((start, min(start + range_size, size) - 1) for start in range(0, size, range_size))
+
+    @staticmethod
+    async def _get_range(client, bucket: str, path: str, start: int, end: int, etag: str) -> bytes:
+        # IfMatch не дает склеить диапазоны разных версий объекта, если его перезапишут во время скачивания
+        response = await client.get_object(Bucket=bucket, Key=path, Range=f'bytes={start}-{end}', IfMatch=etag)
+        async with response['Body'] as stream:
+            return await stream.read()
+
+    async def collect_stale_uploads(self, bucket: str, max_age: float = STALE_UPLOAD_AGE) -> int:
+        """
+        Отменяет незавершенные multipart-загрузки старше max_age секунд: из журнала и все загрузки в bucket,
+        в том числе брошенные без журнала. Журнал после этого сжимается. Возвращает число отмененных загрузок.
+        """
+        client = await self.connect()
+        deadline = time.time() - max_age
+        stale = set()
+        if self.journal is not None:
+            stale.update((upload.bucket, upload.key, upload.upload_id)
+                         for upload in await self.journal.pending()
+                         if upload.created_at < deadline and not self.journal.is_live(upload.upload_id))
+
+        kwargs = {'Bucket': bucket}
+        while True:
+            response = await client.list_multipart_uploads(**kwargs)
+            stale.update((bucket, upload['Key'], upload['UploadId'])
+                         for upload in response.get('Uploads', []) if upload['Initiated'].timestamp() < deadline
+                         and not (self.journal is not None and self.journal.is_live(upload['UploadId'])))
+            if not response.get('IsTruncated'):
+                break
+            kwargs['KeyMarker'] = response['NextKeyMarker']
+            kwargs['UploadIdMarker'] = response['NextUploadIdMarker']
+
+        for upload_bucket, key, upload_id in stale:
+            try:
+                await client.abort_multipart_upload(Bucket=upload_bucket, Key=key, UploadId=upload_id)
+            except ClientError:
+                # загрузка уже завершена или удалена
+                pass
+            if self.journal is not None:
+                await self.journal.discard(upload_id)
+        if self.journal is not None:
+            await self.journal.compact()
+        return len(stale)
+
+
+def _range_total(resp) -> Optional[int]:
+    """Полный размер из Content-Range ответа 416: bytes */<size>"""
+    _, _, total = resp.headers.get('Content-Range', '').rpartition('/')
+    return int(total) if total.isdigit() else None
+
+
+async def _skip_bytes(chunks: AsyncIterator[bytes], count: int) -> AsyncIterator[bytes]:
+    async for data in chunks:
+        if count >= len(data):
+            count -= len(data)
+            continue
+        yield data[count:]
+        count = 0
+
+
+def _read_into(fd, buffer: bytearray) -> int:
+    """Заполняет buffer целиком, меньше - только в конце файла"""
+    view = memoryview(buffer)
+    filled = 0
+    try:
+        while filled < len(buffer):
+            count = fd.readinto(view[filled:])
+            if not count:
+                break
+            filled += count
+    finally:
+        view.release()
+    return filled
@@ -1,36 +1,108 @@
 import aiohttp
+import asyncio
 import json
+import os
+from typing import Optional
 
 from clients.tg.api import TgClient, TgClientError
 from clients.tg.dcs import File, Message
 
 
 class TgClientWithFile(TgClient):
+    # размер записи на диск растет от MIN до MAX, пока файл продолжает качаться
+    DOWNLOAD_MIN_CHUNK = 64 * 1024
+    DOWNLOAD_MAX_CHUNK = 4 * 1024 * 1024
+    # сколько кусков может ждать записи, дальше скачивание ждет диск
+    WRITE_QUEUE_SIZE = 4
+
     async def get_file(self, file_id: str) -> File:
         params = {'file_id': file_id}
         result = await self._perform_request('get', self.get_path('getFile'), params=params)
-        return File.Schema().load(result.get('result'))
-
-    async def download_file(self, file_path: str, destination_path: str):
-        url = f'{self.get_base_path()}/file/bot{self.token}/{file_path}'
-        async with self.session:
-            async with self.session.get(url) as resp:
-                if not resp.status == 200:
-                    raise TgClientError(resp, f'status: {resp.status}')
-                with open(destination_path, 'wb') as fd:
-                    async for data in resp.content.iter_chunked(1024):
-                        fd.write(data)
+        return self._load(File, result.get('result'))
 
-    async def send_document(self, chat_id: int, document_path) -> Message:
-        async with self.session:
-            data = aiohttp.FormData()
-            data.add_field('chat_id', chat_id)
-            data.add_field('document', open(document_path, 'rb'))
-            async with self.session.post(self.get_path('sendDocument'), data=data) as resp:
-                if not resp.status == 200:
-                    raise TgClientError(resp, f'status: {resp.status}')
+    def get_file_url(self, file_path: str) -> str:
+        return f'{self.get_base_path()}/file/bot{self.token}/{file_path}'
+
+    async def download_file(self, file_path: str, destination_path: str, file_size: Optional[int] = None) -> int:
+        """
+        Скачивает файл в destination_path, возвращает число записанных байт.
+        Запись на диск идет в пуле потоков через ограниченную очередь, event loop занят только сетью.
+        Если известен file_size, место под файл выделяется заранее.
+        """
+        url = self.get_file_url(file_path)
+        loop = asyncio.get_running_loop()
+        async with self.session.get(url) as resp:
+            if not resp.status == 200:
+                raise TgClientError(resp, f'status: {resp.status}')
+            fd = await loop.run_in_executor(None, open, destination_path, 'wb')
+            try:
+                if file_size:
+                    await loop.run_in_executor(None, _preallocate, fd, file_size)
+                queue = asyncio.Queue(maxsize=self.WRITE_QUEUE_SIZE)
+                writer = asyncio.create_task(_write_behind(queue, fd))
                 try:
-                    result = await resp.json()
-                    return Message.Schema().load(result.get('result'))
-                except json.decoder.JSONDecodeError as error:
-                    raise TgClientError(resp, error)
+                    written = await self._read_chunks(resp, queue, writer)
+                    await _put_chunk(queue, writer, None)
+                    await writer
+                finally:
+                    writer.cancel()
+                if file_size and written != file_size:
+                    await loop.run_in_executor(None, fd.truncate, written)
+            finally:
+                await loop.run_in_executor(None, fd.close)
+        return written
+
+    async def _read_chunks(self, resp, queue: asyncio.Queue, writer: asyncio.Task) -> int:
+        """Склеивает данные из сети в куски растущего размера и ставит их в очередь записи"""
+        chunk_size = self.DOWNLOAD_MIN_CHUNK
+        buffer = bytearray()
+        written = 0
+        async for data in resp.content.iter_any():
+            buffer += data
+            if len(buffer) >= chunk_size:
+                await _put_chunk(queue, writer, buffer)
+                written += len(buffer)
+                buffer = bytearray()
+                chunk_size = min(chunk_size * 2, self.DOWNLOAD_MAX_CHUNK)
+        if buffer:
+            await _put_chunk(queue, writer, buffer)
+            written += len(buffer)
+        return written
+
+    async def send_document(self, chat_id: int, document_path) -> Message:
+        data = aiohttp.FormData()
+        data.add_field('chat_id', chat_id)
+        data.add_field('document', open(document_path, 'rb'))
+        async with self.session.post(self.get_path('sendDocument'), data=data) as resp:
+            if not resp.status == 200:
+                raise TgClientError(resp, f'status: {resp.status}')
+            try:
+                result = await self._read_json(resp)
+                return self._load(Message, result.get('result'))
+            except json.decoder.JSONDecodeError as error:
+                raise TgClientError(resp, error)
+
+
+async def _put_chunk(queue: asyncio.Queue, writer: asyncio.Task, data: Optional[bytearray]):
+    # если запись упала, очередь больше никто не разбирает, ошибку писателя пробрасываем сразу
+    put = asyncio.ensure_future(queue.put(data))
+    await asyncio.wait({put, writer}, return_when=asyncio.FIRST_COMPLETED)
+    if not put.done():
+        put.cancel()
+        writer.result()
+
+
+async def _write_behind(queue: asyncio.Queue, fd):
+    loop = asyncio.get_running_loop()
+    while True:
+        data = await queue.get()
+        if data is None:
+            return
+        await loop.run_in_executor(None, fd.write, data)
+
+
+def _preallocate(fd, size: int):
+    if hasattr(os, 'posix_fallocate'):
+        os.posix_fallocate(fd.fileno(), 0, size)
+    else:
+        fd.truncate(size)
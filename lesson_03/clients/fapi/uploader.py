@@ -1,11 +1,32 @@
-from typing import List, Optional
+import asyncio
+from typing import Callable, Dict, List, Optional
+
+import aiohttp
+from botocore.exceptions import ClientError, ConnectionError as BotoConnectionError, HTTPClientError
+
+from clients.fapi.journal import JournalUpload, UploadJournal
 
 
 class MultipartUploader:
-    def __init__(self, client, bucket: str, key: str) -> None:
+    RETRY_DELAY = 1
+    # коды ошибок s3, при которых запрос имеет смысл повторить, кроме любых 5xx
+    RETRY_ERROR_CODES = {'RequestTimeout', 'SlowDown', 'Throttling', 'ThrottlingException', 'RequestTimeTooSkewed'}
+
+    def __init__(self, client, bucket: str, key: str, concurrency: int = 1, max_retries: int = 3,
+                 journal: Optional[UploadJournal] = None, source: Optional[str] = None,
+                 metadata: Optional[Dict[str, str]] = None) -> None:
         self.client = client
         self.bucket = bucket
         self.key = key
+        # сколько частей одновременно в полете, память ограничена concurrency * размер части
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.metadata = metadata
+        # с журналом загрузка не отменяется при ошибке и продолжается при следующем запуске с тем же source
+        self.journal = journal if source is not None else None
+        self.source = source
+        # сколько байт источника уже загружено в подтвержденных частях, с этого места нужно продолжать чтение
+        self.resume_offset: int = 0
 
         self.part_number: int = 0
         self.parts: List[dict] = []
@@ -13,53 +34,191 @@ class MultipartUploader:
         self.uploaded_size: float = 0
         self.is_loading: bool = False
 
+        self._window: Optional[asyncio.Semaphore] = None
+        self._tasks: List[asyncio.Task] = []
+
     async def __aenter__(self):
         await self._create_uploading()
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         if not exc_type:
+            try:
+                await self._wait_parts()
+            except BaseException:
+                await self._cancel_parts()
+                await self._stop_uploading()
+                raise
             await self._finish_uploading()
         else:
-            await self.client.abort_multipart_upload(
-                Bucket=self.bucket,
-                Key=self.key,
-                UploadId=self.mpu["UploadId"],
-            )
+            await self._cancel_parts()
+            await self._stop_uploading()
+
+    async def _stop_uploading(self) -> None:
+        # загрузку из журнала оставляем на s3, чтобы продолжить ее позже или удалить при сборке мусора
+        if self.journal is None:
+            await self._abort_uploading()
+        else:
+            if self.mpu is not None:
+                self.journal.release(self.mpu["UploadId"])
+            self.is_loading = False
 
     async def _create_uploading(self) -> None:
         self.parts = []
         self.part_number = 1
+        self._tasks = []
+        self._window = asyncio.Semaphore(self.concurrency)
+        self.is_loading = True
+        self.uploaded_size = 0
+        self.resume_offset = 0
+
+        if self.journal is not None:
+            upload = await self.journal.acquire(self.bucket, self.key, self.source)
+            if upload is not None and await self._resume_uploading(upload):
+                return
 
         self.mpu = await self.client.create_multipart_upload(
             Bucket=self.bucket,
             Key=self.key,
+            **({"Metadata": self.metadata} if self.metadata else {}),
         )
+        if self.journal is not None:
+            await self.journal.created(self.mpu["UploadId"], self.bucket, self.key, self.source)
 
-        self.is_loading = True
-        self.uploaded_size = 0
+    async def _resume_uploading(self, upload: JournalUpload) -> bool:
+        """
+        Сверяет части из журнала с list_parts и продолжает загрузку после непрерывного префикса
+        подтвержденных частей. Если загрузки на s3 уже нет, возвращает False.
+        """
+        try:
+            confirmed = await self._list_parts(upload.upload_id)
+        except ClientError:
+            await self.journal.aborted(upload.upload_id)
+            return False
+        except BaseException:
+            self.journal.release(upload.upload_id)
+            raise
 
-    async def upload_part(self, chunk: bytes) -> None:
-        part = await self.client.upload_part(
-            Bucket=self.bucket,
-            Key=self.key,
-            PartNumber=self.part_number,
-            UploadId=self.mpu["UploadId"],
-            Body=chunk,
-        )
+        number = 1
+        while number in upload.parts and confirmed.get(number) == upload.parts[number][1]:
+            size, etag = upload.parts[number]
+            self.parts.append({"PartNumber": number, "ETag": etag})
+            self.resume_offset += size
+            number += 1
+
+        self.mpu = {"UploadId": upload.upload_id}
+        self.part_number = number
+        self.uploaded_size = self.resume_offset / 1024 / 1024
+        return True
 
-        self.parts.append({"PartNumber": self.part_number, "ETag": part["ETag"]})
+    async def _list_parts(self, upload_id: str) -> dict:
+        parts = {}
+        kwargs = {"Bucket": self.bucket, "Key": self.key, "UploadId": upload_id}
+        while True:
+            response = await self.client.list_parts(**kwargs)
+            for part in response.get("Parts", []):
+                parts[part["PartNumber"]] = part["ETag"]
+            if not response.get("IsTruncated"):
+                return parts
+            kwargs["PartNumberMarker"] = response["NextPartNumberMarker"]
+
+    async def upload_part(self, chunk: bytes, release: Optional[Callable[[bytes], None]] = None) -> None:
+        """
+        Отправляет часть файла. При concurrency > 1 возвращается, как только часть поставлена в окно загрузки,
+        и ждет только если в полете уже concurrency частей.
+        release вызывается с chunk, когда буфер части больше не нужен загрузчику.
+        """
+        part_number = self.part_number
         self.part_number += 1
 
+        if self.concurrency <= 1:
+            try:
+                await self._upload_part(part_number, chunk)
+            finally:
+                if release:
+                    release(chunk)
+            return
+
+        self._raise_failed()
+        await self._window.acquire()
+        task = asyncio.create_task(self._upload_part_in_window(part_number, chunk, release))
+        self._tasks.append(task)
+
+    async def _upload_part_in_window(self, part_number: int, chunk: bytes, release=None) -> None:
+        try:
+            await self._upload_part(part_number, chunk)
+        finally:
+            self._window.release()
+            if release:
+                release(chunk)
+
+    async def _upload_part(self, part_number: int, chunk: bytes) -> None:
+        attempt = 0
+        while True:
+            try:
+                part = await self.client.upload_part(
+                    Bucket=self.bucket,
+                    Key=self.key,
+                    PartNumber=part_number,
+                    UploadId=self.mpu["UploadId"],
+                    Body=chunk,
+                )
+                break
+            except Exception as error:
+                attempt += 1
+                if attempt > self.max_retries or not self._is_retryable(error):
+                    raise
+                await asyncio.sleep(self.RETRY_DELAY * attempt)
+
+        self.parts.append({"PartNumber": part_number, "ETag": part["ETag"]})
+        if self.journal is not None:
+            await self.journal.part(self.mpu["UploadId"], part_number, len(chunk), part["ETag"])
+
         self.uploaded_size += len(chunk) / 1024 / 1024
         print(self.uploaded_size)
 
+    def _is_retryable(self, error: Exception) -> bool:
+        """Повторяем только сетевые ошибки, 5xx и троттлинг, остальные ответы s3 не изменятся"""
+        if isinstance(error, ClientError):
+            status = error.response.get('ResponseMetadata', {}).get('HTTPStatusCode') or 0
+            return status >= 500 or error.response.get('Error', {}).get('Code') in self.RETRY_ERROR_CODES
+        network_errors = (HTTPClientError, BotoConnectionError, aiohttp.ClientError, asyncio.TimeoutError, OSError)
+        return isinstance(error, network_errors)
+
+    def _raise_failed(self) -> None:
+        for task in self._tasks:
+            if task.done() and not task.cancelled() and task.exception():
+                raise task.exception()
+        self._tasks = [task for task in self._tasks if not task.done()]
+
+    async def _wait_parts(self) -> None:
+        await asyncio.gather(*self._tasks)
+        self._tasks = []
+
+    async def _cancel_parts(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _abort_uploading(self) -> None:
+        await self.client.abort_multipart_upload(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.mpu["UploadId"],
+        )
+        if self.journal is not None:
+            await self.journal.aborted(self.mpu["UploadId"])
+        self.is_loading = False
+
     async def _finish_uploading(self) -> None:
-        part_info = {"Parts": self.parts}
+        part_info = {"Parts": sorted(self.parts, key=lambda item: item["PartNumber"])}
         await self.client.complete_multipart_upload(
             Bucket=self.bucket,
             Key=self.key,
             UploadId=self.mpu["UploadId"],
             MultipartUpload=part_info,
         )
+        if self.journal is not None:
+            await self.journal.completed(self.mpu["UploadId"])
         self.is_loading = False
@@ -22,7 +22,7 @@ class LmsClient(Client):
         if not resp.status == 200:
             raise LmsClientError(resp, f'status: {resp.status}')
         try:
-            response = await resp.json()
+            response = await self._read_json(resp)
             if not response:
                 raise LmsClientError(resp, 'empty response')
             return response, resp
@@ -0,0 +1,60 @@
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Optional
+
+import aiohttp
+
+
+@dataclass
+class SessionPoolConfig:
+    limit: int = 100
+    limit_per_host: int = 10
+    keepalive_timeout: float = 30
+    ttl_dns_cache: int = 300
+
+
+class SessionPool:
+    """
+    Общая для всего процесса aiohttp-сессия с пулом соединений.
+    Пока пул запущен, клиенты используют его сессию и не платят за TCP+TLS хендшейк и DNS на каждый запрос.
+    """
+    _session: Optional[aiohttp.ClientSession] = None
+    config: SessionPoolConfig = SessionPoolConfig()
+
+    @classmethod
+    async def start(cls, config: Optional[SessionPoolConfig] = None) -> aiohttp.ClientSession:
+        if config:
+            cls.config = config
+        if cls._session is None or cls._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=cls.config.limit,
+                limit_per_host=cls.config.limit_per_host,
+                keepalive_timeout=cls.config.keepalive_timeout,
+                use_dns_cache=True,
+                ttl_dns_cache=cls.config.ttl_dns_cache,
+            )
+            cls._session = aiohttp.ClientSession(connector=connector)
+        return cls._session
+
+    @classmethod
+    def get(cls) -> Optional[aiohttp.ClientSession]:
+        if cls._session is None or cls._session.closed:
+            return None
+        return cls._session
+
+    @classmethod
+    async def stop(cls):
+        if cls._session is not None:
+            await cls._session.close()
+        cls._session = None
+
+
+@asynccontextmanager
+async def shared_session():
+    """Отдает общую сессию, если пул запущен, иначе временную сессию, которая закрывается на выходе"""
+    session = SessionPool.get()
+    if session is not None:
+        yield session
+    else:
+        async with aiohttp.ClientSession() as session:
+            yield session
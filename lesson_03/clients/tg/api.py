@@ -3,6 +3,7 @@ import json
 import marshmallow
 
 from clients.base import ClientError, Client
+from clients.tg import decoder
 from clients.tg.dcs import UpdateObj, Message, GetUpdatesResponse
 
 
@@ -10,9 +11,19 @@ class TgClientError(ClientError):
     pass
 
 
+class TgRetryAfterError(TgClientError):
+    """Ответ 429: Telegram просит повторить запрос не раньше чем через retry_after секунд"""
+
+    def __init__(self, response, content=None, retry_after: float = 1):
+        super().__init__(response, content)
+        self.retry_after = retry_after
+
+
 class TgClient(Client):
 
     BASE_PATH = 'https://api.telegram.org'
+    # собирать датаклассы быстрым декодером вместо полной валидации marshmallow
+    FAST_DECODE = True
 
     def __init__(self, token: str = ''):
         super().__init__()
@@ -32,18 +43,34 @@ class TgClient(Client):
                                            params={key: params.get(key) for key in params if params.get(key)})
 
     async def _handle_response(self, response):
+        if response.status == 429:
+            raise TgRetryAfterError(response, f'status: {response.status}', await self._get_retry_after(response))
         if not response.status == 200:
             raise TgClientError(response, f'status: {response.status}')
         try:
-            data = await response.json()
+            data = await self._read_json(response)
             return data
         except json.decoder.JSONDecodeError as error:
             raise TgClientError(response, error)
 
+    async def _get_retry_after(self, response) -> float:
+        try:
+            data = await self._read_json(response)
+            return data['parameters']['retry_after']
+        except (json.decoder.JSONDecodeError, KeyError, TypeError):
+            return 1
+
+    def _load(self, cls, data):
+        return decoder.load(cls, data, fast=self.FAST_DECODE)
+
     async def get_updates_in_objects(self, *args, **kwargs) -> List[UpdateObj]:
         response = await self.get_updates(*args, **kwargs)
+        return self.decode_updates(response)
+
+    def decode_updates(self, response: dict) -> List[UpdateObj]:
+        """Разбирает ответ get_updates в UpdateObj"""
         try:
-            data = GetUpdatesResponse.Schema().load(response)
+            data = self._load(GetUpdatesResponse, response)
             return data.result
         except marshmallow.exceptions.ValidationError as error:
             raise TgClientError(response, error)
@@ -55,7 +82,7 @@ class TgClient(Client):
         }
         response = await self._perform_request('post', self.get_path('sendMessage'), json=message)
         try:
-            data = Message.Schema().load(response.get('result'))
+            data = self._load(Message, response.get('result'))
             return data
         except marshmallow.exceptions.ValidationError as error:
             raise TgClientError(response, error)
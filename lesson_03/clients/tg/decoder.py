@@ -0,0 +1,106 @@
+import typing
+from dataclasses import MISSING, fields, is_dataclass
+from typing import Any, Callable, Dict, Type, TypeVar
+
+from marshmallow import Schema
+
+T = TypeVar('T')
+
+_SCHEMAS: Dict[type, Schema] = {}
+_DECODERS: Dict[type, Callable[[Any], Any]] = {}
+_PRIMITIVES = (int, str, bool, float, dict)
+
+
+class _SlowPath(Exception):
+    """Данные не подходят для быстрого декодера, их нужно разбирать схемой marshmallow"""
+
+
+def get_schema(cls: Type[T]) -> Schema:
+    """Возвращает закешированный экземпляр схемы marshmallow для датакласса"""
+    schema = _SCHEMAS.get(cls)
+    if schema is None:
+        schema = _SCHEMAS[cls] = cls.Schema()
+    return schema
+
+
+def load(cls: Type[T], data: Any, fast: bool = True) -> T:
+    """
+    Превращает dict в датакласс cls.
+    Быстрый путь собирает объекты напрямую, без валидации marshmallow, игнорируя неизвестные ключи (как EXCLUDE).
+    Если данные не проходят проверки быстрого пути, они разбираются схемой, поэтому ошибки
+    остаются теми же marshmallow.ValidationError.
+    """
+    if fast:
+        try:
+            return get_decoder(cls)(data)
+        except _SlowPath:
+            pass
+    return get_schema(cls).load(data)
+
+
+def get_decoder(cls: Type[T]) -> Callable[[Any], T]:
+    decoder = _DECODERS.get(cls)
+    if decoder is None:
+        decoder = _DECODERS[cls] = _compile(cls)
+    return decoder
+
+
+def _compile(cls: type) -> Callable[[Any], Any]:
+    hints = typing.get_type_hints(cls)
+    specs = []
+    for item in fields(cls):
+        if not item.init:
+            continue
+        required = item.default is MISSING and item.default_factory is MISSING
+        key = item.metadata.get('data_key', item.name)
+        specs.append((item.name, key, required, _converter(hints[item.name])))
+
+    def decode(data):
+        if type(data) is not dict:
+            raise _SlowPath
+        kwargs = {}
+        for name, key, required, convert in specs:
+            if key in data:
+                kwargs[name] = convert(data[key])
+            elif required:
+                raise _SlowPath
+        return cls(**kwargs)
+
+    return decode
+
+
+def _converter(tp) -> Callable[[Any], Any]:
+    origin = typing.get_origin(tp)
+    args = typing.get_args(tp)
+
+    if origin is typing.Union and type(None) in args:
+        inner = _converter(next(arg for arg in args if arg is not type(None)))
+        return lambda value: None if value is None else inner(value)
+
+    if origin is list:
+        inner = _converter(args[0]) if args else _any
+
+        def convert_list(value):
+            if type(value) is not list:
+                raise _SlowPath
+            return [inner(item) for item in value]
+
+        return convert_list
+
+    if is_dataclass(tp):
+        # декодер вложенного класса берется при вызове, так работают и рекурсивные типы вроде File.thumb
+        return lambda value: get_decoder(tp)(value)
+
+    if tp in _PRIMITIVES:
+        def convert_primitive(value):
+            if type(value) is not tp:
+                raise _SlowPath
+            return value
+
+        return convert_primitive
+
+    return _any
+
+
+def _any(value):
+    return value
@@ -19,12 +19,12 @@ async def s3():
         aws_secret_access_key=os.getenv("MINIO_ROOT_PASSWORD"),
         aws_access_key_id=os.getenv("MINIO_ROOT_USER")
     )
-    s3cli = S3Client(**cr)
-    await s3cli.stream_upload(
-        'test_bucket',
-        'bbabae8bcbce1.mov',
-        'https://lms-metaclass-prod.hb.bizmrg.com/media/019c3374-9099-4c49-9037-bbabae8bcbce.mov'
-    )
+    async with S3Client(**cr) as s3cli:
+        await s3cli.stream_upload(
+            'test_bucket',
+            'bbabae8bcbce1.mov',
+            'https://lms-metaclass-prod.hb.bizmrg.com/media/019c3374-9099-4c49-9037-bbabae8bcbce.mov'
+        )
 
 
 if __name__ == '__main__':
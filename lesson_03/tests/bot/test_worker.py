@@ -0,0 +1,82 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+
+from botocore.exceptions import ClientError
+
+from bot.worker import Worker, WorkerConfig
+
+
+class FakeS3:
+    """Бакет в памяти: ключ -> (содержимое, метаданные)"""
+
+    def __init__(self):
+        self.objects = {}
+        self.uploads = 0
+        self.copies = 0
+
+    async def upload_from_url(self, bucket, path, url, size=None, source=None, metadata=None):
+        self.uploads += 1
+        await asyncio.sleep(0.01)
+        self.objects[path] = (url, metadata or {})
+
+    async def copy_file(self, source_bucket, source_path, bucket, path):
+        self.copies += 1
+        self.objects[path] = self.objects[source_path]
+
+    async def get_metadata(self, bucket, path):
+        if path not in self.objects:
+            raise ClientError({'Error': {'Code': '404'}}, 'HeadObject')
+        return self.objects[path][1]
+
+    async def close(self):
+        pass
+
+
+class FakeTgClient:
+    def __init__(self, token):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    async def get_file(self, file_id):
+        return SimpleNamespace(file_path=file_id, file_size=10)
+
+    def get_file_url(self, file_path):
+        return f'content-of-{file_path}'
+
+
+def document_update(unique_id: str, file_name: str):
+    document = SimpleNamespace(file_id=unique_id, file_unique_id=unique_id, file_name=file_name, file_size=10)
+    return SimpleNamespace(message=SimpleNamespace(document=document))
+
+
+class TestUploadFile(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.worker = Worker('token', asyncio.Queue(), WorkerConfig('http://s3', 'secret', 'key', 'bucket'))
+        self.s3 = self.worker.s3 = FakeS3()
+        self.worker.client = FakeTgClient
+
+    async def asyncTearDown(self):
+        self.worker.uploads.close()
+
+    async def test_concurrent_repeats_upload_once(self):
+        await asyncio.gather(
+            self.worker._upload_file(document_update('A', 'a.pdf')),
+            self.worker._upload_file(document_update('A', 'a.pdf')),
+            self.worker._upload_file(document_update('A', 'copy.pdf')),
+        )
+        self.assertEqual(self.s3.uploads, 1)
+        self.assertEqual(self.s3.objects['a.pdf'][0], 'content-of-A')
+        self.assertEqual(self.s3.objects['copy.pdf'][0], 'content-of-A')
+
+    async def test_overwritten_name_is_uploaded_again(self):
+        await self.worker._upload_file(document_update('A', 'x.pdf'))
+        await self.worker._upload_file(document_update('B', 'x.pdf'))
+        await self.worker._upload_file(document_update('A', 'x.pdf'))
+        self.assertEqual(self.s3.uploads, 3)
+        self.assertEqual(self.s3.objects['x.pdf'][0], 'content-of-A')
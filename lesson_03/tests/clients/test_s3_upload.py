@@ -0,0 +1,103 @@
+import asyncio
+import datetime
+import os
+import tempfile
+import unittest
+
+from clients.fapi.s3 import S3Client
+
+
+class FakeS3:
+    """Минимальный s3-клиент с multipart-загрузками в памяти"""
+
+    def __init__(self):
+        self.uploads = {}
+        self.objects = {}
+        self.created = 0
+        self.fail_part = None
+
+    async def create_multipart_upload(self, Bucket, Key):
+        self.created += 1
+        upload_id = f'upload-{self.created}'
+        self.uploads[upload_id] = {'key': Key, 'parts': {}, 'initiated': datetime.datetime.now(datetime.timezone.utc)}
+        return {'UploadId': upload_id}
+
+    async def upload_part(self, Bucket, Key, PartNumber, UploadId, Body):
+        if PartNumber == self.fail_part:
+            raise RuntimeError('crash')
+        if UploadId not in self.uploads:
+            raise RuntimeError('NoSuchUpload')
+        # части разных загрузок идут вперемешку
+        await asyncio.sleep(0.001)
+        self.uploads[UploadId]['parts'][PartNumber] = bytes(Body)
+        return {'ETag': f'etag-{PartNumber}-{len(Body)}'}
+
+    async def list_parts(self, Bucket, Key, UploadId, **kwargs):
+        parts = self.uploads[UploadId]['parts']
+        return {'Parts': [{'PartNumber': number, 'ETag': f'etag-{number}-{len(body)}'}
+                          for number, body in parts.items()]}
+
+    async def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        if UploadId not in self.uploads:
+            raise RuntimeError('NoSuchUpload')
+        parts = self.uploads.pop(UploadId)['parts']
+        self.objects[Key] = b''.join(parts[part['PartNumber']] for part in MultipartUpload['Parts'])
+
+    async def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.uploads.pop(UploadId, None)
+
+    async def list_multipart_uploads(self, Bucket, **kwargs):
+        return {'Uploads': [{'Key': upload['key'], 'UploadId': upload_id, 'Initiated': upload['initiated']}
+                            for upload_id, upload in self.uploads.items()]}
+
+
+class TestJournaledUpload(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.source = os.path.join(self.tmp.name, 'source')
+        self.data = os.urandom(35)
+        with open(self.source, 'wb') as fd:
+            fd.write(self.data)
+        self.fake = FakeS3()
+
+    async def asyncTearDown(self):
+        self.tmp.cleanup()
+
+    def make_client(self) -> S3Client:
+        client = S3Client('http://s3', 'key', 'secret', journal_path=os.path.join(self.tmp.name, 'journal'))
+        client.UPLOAD_READ_SIZE = 10
+        client._client = self.fake
+        return client
+
+    async def test_resume_after_crash(self):
+        self.fake.fail_part = 3
+        with self.assertRaises(RuntimeError):
+            await self.make_client().stream_file('bucket', 'key', self.source)
+        self.fake.fail_part = None
+
+        await self.make_client().stream_file('bucket', 'key', self.source)
+        self.assertEqual(self.fake.objects['key'], self.data)
+        self.assertEqual(self.fake.created, 1)
+
+    async def test_concurrent_uploads_of_same_source(self):
+        client = self.make_client()
+        await asyncio.gather(
+            client.stream_file('bucket', 'key', self.source),
+            client.stream_file('bucket', 'key', self.source),
+        )
+        self.assertEqual(self.fake.created, 2)
+        self.assertEqual(self.fake.objects['key'], self.data)
+        self.assertEqual(await client.journal.pending(), [])
+
+    async def test_collect_skips_live_uploads(self):
+        client = self.make_client()
+        self.fake.fail_part = 2
+        with self.assertRaises(RuntimeError):
+            await client.stream_file('bucket', 'stale', self.source)
+        self.fake.fail_part = None
+        live = await client.journal.acquire('bucket', 'stale', (await client.journal.pending())[0].source)
+
+        self.assertEqual(await client.collect_stale_uploads('bucket', max_age=-1), 0)
+        client.journal.release(live.upload_id)
+        self.assertEqual(await client.collect_stale_uploads('bucket', max_age=-1), 1)
+        self.assertEqual(self.fake.uploads, {})
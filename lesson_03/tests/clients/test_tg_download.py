@@ -0,0 +1,89 @@
+import asyncio
+import errno
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from aiohttp import web
+
+from clients.fapi.tg import TgClientWithFile
+
+CHUNK_SIZE = 64 * 1024
+CHUNKS_COUNT = 5
+
+
+class FailingFile:
+    """Файл, запись в который медленно падает с ENOSPC"""
+
+    def __init__(self, *args, **kwargs):
+        self.closed = False
+
+    def write(self, data):
+        time.sleep(0.1)
+        raise OSError(errno.ENOSPC, 'No space left on device')
+
+    def truncate(self, size):
+        pass
+
+    def fileno(self):
+        raise OSError(errno.EBADF, 'no descriptor')
+
+    def close(self):
+        self.closed = True
+
+
+class TestDownloadFile(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.body = os.urandom(CHUNK_SIZE * CHUNKS_COUNT)
+
+        async def handler(request):
+            response = web.StreamResponse()
+            await response.prepare(request)
+            for start in range(0, len(self.body), CHUNK_SIZE):
+                await response.write(self.body[start:start + CHUNK_SIZE])
+                # куски приходят по отдельности и не склеиваются в один большой
+                await asyncio.sleep(0.005)
+            return response
+
+        app = web.Application()
+        app.router.add_get('/{path:.*}', handler)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+
+        self.client = TgClientWithFile('token')
+        self.client.get_file_url = lambda file_path: f'http://127.0.0.1:{port}/{file_path}'
+        # размер куска не растет, чтобы очередь записи заполнялась целиком
+        self.client.DOWNLOAD_MIN_CHUNK = self.client.DOWNLOAD_MAX_CHUNK = CHUNK_SIZE
+        self.client.WRITE_QUEUE_SIZE = 4
+        self.tmp = tempfile.TemporaryDirectory()
+
+    async def asyncTearDown(self):
+        await self.client.__aexit__(None, None, None)
+        await self.runner.cleanup()
+        self.tmp.cleanup()
+
+    async def test_download(self):
+        destination = os.path.join(self.tmp.name, 'file')
+        written = await self.client.download_file('doc', destination, file_size=len(self.body) + 100)
+        self.assertEqual(written, len(self.body))
+        with open(destination, 'rb') as fd:
+            self.assertEqual(fd.read(), self.body)
+
+    async def test_failing_writer_raises(self):
+        files = []
+
+        def fake_open(*args, **kwargs):
+            files.append(FailingFile())
+            return files[-1]
+
+        with mock.patch('clients.fapi.tg.open', fake_open, create=True):
+            with self.assertRaises(OSError) as context:
+                await asyncio.wait_for(self.client.download_file('doc', os.path.join(self.tmp.name, 'file')), 5)
+        # TimeoutError тоже OSError, поэтому проверяем, что проброшена именно ошибка записи
+        self.assertEqual(context.exception.errno, errno.ENOSPC)
+        self.assertTrue(files[0].closed)
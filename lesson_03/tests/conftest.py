@@ -0,0 +1,5 @@
+import os
+import sys
+
+# модули lesson_03 импортируются от корня урока: from clients..., from bot...
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))